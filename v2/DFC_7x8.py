@@ -2,12 +2,15 @@
 
 import sys
 import logging
-import threading
 import time
 import numpy as np
 import signal
 
-from service import FLService # FieldLine api needed for this
+try:
+    from service import FLService # FieldLine api needed for this
+except ImportError:
+    FLService = None # only --replay is possible without it
+from replay import ReplayService # offline runs from a recorded session
 from numato import numato # class used to control the test dipole coil
 #from sensorMapping import * # to map channel names <---> coordinates & orientations 
 #from prepForDFC import *
@@ -18,14 +21,21 @@ from filters import * # filter ref sensors
 from sensors import *
 from presets import * # this allows to select which sensors are selected for DFC 
 from io_dfc import *
-
-import tensorly as tl # use sensors to compute compensation values
-from collections import deque
+from frames import * # decode data frames into numpy rows, check timestamps
+
+from compensation import * # use sensors to compute compensation values
+from dispatch import AdjustDispatcher # send compensation values to the chassis
+from latency import * # per-stage latency of the DFC loop
+from predictor import RefPredictor # forecast the refs at the time the update is applied
+from ringbuffer import RingBuffer # hand samples from the callback to the main loop
+from recorder import * # stream recorded samples to disk in chunks
+import os
 from constants import * 
 
-import gc # garbage collector
-if gc.isenabled():
-    gc.disable()
+from gcpolicy import GCPolicy # garbage collection during acquisition
+from pipeline import * # hand recorded rows to the persistence stage
+from convert_worker import submitJob # convert to .fif in the background
+from status import * # console status, printed outside the DFC loop
     
     
 #%%
@@ -49,33 +59,11 @@ tCoilStart = 0 # control when to energize coil after fine-zero has been complete
 count  = -1
 done = False
 
-def main(p, logger): #@@ use logging module 
-
-
-    #### ----------------------------------------------------------- ####
-    #                      INITIALIZE QUEUE                             # 
-    #### ----------------------------------------------------------- ####
-    
-    
-    # queue is needed to access bz data outside the getData callback
-
-    q = deque()
-    event = threading.Event()
-
-    def getData(data):
-
-        """ 
-        This function is a callback to read the data structure in the stream.
-        The data are place in a queue which can be accessed outside of this function.
-        """
+def main(p, logger, service=None, s_sens=None, geometry=None): #@@ use logging module 
 
-        global count
-
-        count += 1
-        q.append(data)
-        event.set()
+    # service, s_sens and geometry (cellCoords, rotMat) can be given instead of
+    # being taken from the hardware, e.g. by benchmarks/scaling.py
 
-    
     #### ----------------------------------------------------------- ####
     #                      PREPARE FOR DFC                              # 
     #### ----------------------------------------------------------- ####
@@ -83,9 +71,6 @@ def main(p, logger): #@@ use logging module
        
     # initialize class instances
     
-    s_sens = SensorManager()
-    s_sens.logger = logger # give logging properties to s_sens    
-    
     s_data = struct()        
     
     # init the test coil
@@ -96,13 +81,20 @@ def main(p, logger): #@@ use logging module
         coil.deactivate()   # make sure all coils are off
         onceCoil = True
 
-    # Get FieldLine service
+    # Get FieldLine service, or replay a recording in its place
     
-    service = FLService(p.ip_list)
+    if service is None and p.replay:
+        service = ReplayService(p.replay, p.playbackSpeed, p.playbackClock)
+    elif service is None:
+        service = FLService(p.ip_list)
+    replaying = isinstance(service, ReplayService)
       
     # Get sensor index/name/calib information
      
-    s_sens, service = s_sens.prepareForDFC(service, s_data, p)
+    if s_sens is None:
+        s_sens = SensorManager()
+        s_sens.logger = logger # give logging properties to s_sens    
+        s_sens, service = s_sens.prepareForDFC(service, s_data, p)
     
     # set up filter params
     
@@ -110,7 +102,7 @@ def main(p, logger): #@@ use logging module
 
     # load cell positions, coil orientations
     
-    cellCoords, rotMat = extractArrayInfo()    
+    cellCoords, rotMat = extractArrayInfo() if geometry is None else geometry
     
     # extract variables from s_sens and p for efficient DFC computation
 
@@ -118,10 +110,89 @@ def main(p, logger): #@@ use logging module
     td = p.duration
     runDFC = p.runDFC
 
+    # build the frame decoder once, so each sample is a single gather + scale
+
+    decoder = FrameDecoder(chNames_Ref, chNames_Prim, ADCnames, calib)
+
+    # precompute the compensation matrix for the selected sensors
+
+    if runDFC > 0:
+        kernel = CompensationKernel(rotMat, selInArray)
+        payload = PayloadBuilder(selCSs, chassID)
+
+        # only send sensors that moved past the deadband or went stale
+
+        deadband = None
+        if p.deadband > 0:
+            deadband = Deadband(kernel.N, p.deadband, int(p.maxStale*fs))
+
+        # send updates at DFCRate on the sample clock (or after every drain)
+
+        scheduler = UpdateScheduler(p.DFCRate, fs)
+
+        # one row of stage stamps per update (see latency.py)
+
+        recLat = ChunkRecorder(p.sPath + "_latency.bin", len(STAGES), chunkLen)
+        latTap = Tap(recLat, ringLen)
+        lat = np.zeros((1, len(STAGES)))
+
+        # optionally forecast the refs over the measured latency + filter delay
+
+        predictor = None
+        if p.predictor != 'none':
+            lead = filter_ref.delay[0]
+            predictor = RefPredictor(len(chNames_Ref), p.predictor, lead=lead, fs=fs)
+            logger.info(f"{p.predictor} predictor, lead {lead:.2f} samples")
+
+        # send payloads with one call, or per chassis on a thread pool
+
+        recDispatch = ChunkRecorder(p.sPath + "_dispatch.bin", len(chassID)+1, chunkLen)
+        dispatchTap = Tap(recDispatch, ringLen)
+        dispatch = AdjustDispatcher(service, chassID, p.parallelDispatch, dispatchTap)
+
+    #### ----------------------------------------------------------- ####
+    #                   INITIALIZE RING BUFFER                          # 
+    #### ----------------------------------------------------------- ####
+
+    # the callback decodes every frame straight into a ring buffer, which
+    # the main loop reads without copying (see ringbuffer.py)
+
+    # the last column of each row holds the arrival time (ns, from tStart)
+
+    ring = RingBuffer(ringLen, decoder.nCols + 1)
+    tStart = time.perf_counter_ns()
+    acqStats = StageStats('acquisition')
+
+    def getData(data):
+
+        """ 
+        This function is a callback to read the data structure in the stream.
+        Each frame is decoded into the next free row of the ring buffer, which
+        can be accessed outside of this function.
+        """
+
+        global count
+
+        tCall = time.perf_counter_ns()
+        count += 1
+
+        # show data_frame dictionary keys for first frame
+        if count == 0:
+            logger.info(f"keys in dataframe\n{list(data['data_frames'].keys())}")
+
+        row = ring.reserve()
+        if row is not None:
+            decoder(data, out=row[:-1])
+            row[-1] = time.perf_counter_ns() - tStart
+            ring.commit()
+
+        acqStats.record(time.perf_counter_ns() - tCall, ring.available())
+
     # ask user to press enter to start doing fine zero + collecting data
     
-    print("Press Enter")
-    sys.stdin.read(1)
+    if not replaying:
+        print("Press Enter")
+        sys.stdin.read(1)
 
     #### ----------------------------------------------------------- ####
     #                            MAIN LOOP                              # 
@@ -136,24 +207,33 @@ def main(p, logger): #@@ use logging module
 
     filter_ref.restart()
     
-    # preallocate memory
+    # stream raw data (decoded rows, see frames.py) and DFC times to disk, 
+    # so memory use does not depend on the recording duration
     
-    arrLen = int(td*fs) + 50 # to account for len(queue)>1 in the last iteration of loop
-    t_arr = np.empty((arrLen,1))
-    t_DFC = np.ones((arrLen,1)) * -1
+    rec = ChunkRecorder(p.sPath + "_stream.bin", ring.nCols, chunkLen)
+    recDFC = ChunkRecorder(p.sPath + "_tdfc.bin", 2, chunkLen)
+    t_DFC = np.full((1,2), -1.) # time and sample index of the last update
+
+    # the DFC loop only copies rows into taps; a separate persistence stage 
+    # moves them into the recorders
+
+    rawTap = Tap(rec, 4*ringLen)
+    dfcTap = Tap(recDFC, ringLen)
+    taps = [rawTap, dfcTap] + ([latTap, dispatchTap] if runDFC > 0 else [])
+    dfcStats = StageStats('DFC')
+
+    persist = PersistStage(taps)
 
-    nADC = len(s_sens.ADCchas)
-    nRef = len(chNames_Ref)
-    nPrim = len(chNames_Prim)
+    # console status at 2 Hz from its own thread
 
-    rawDataRef = np.empty((arrLen, nRef))
-    rawDataPrim = np.empty((arrLen, nPrim))
-    rawDataADC = np.empty((arrLen, nADC))
+    counters = LoopCounters()
+    reporter = StatusReporter(counters, ring, rate=2, fs=fs)
     
     # define counters
     
     t0 = None
     sDropped = 0
+    tWait = 1 if replaying else None # a replay ends when the recording runs out
     sampleCount, dfcC = -1, -1
     
     # start streaming adc
@@ -168,14 +248,21 @@ def main(p, logger): #@@ use logging module
     service.fineZero(s_sens.sdict)
     fztime = time.perf_counter_ns() - tfz0
 
+    # freeze setup objects and turn automatic garbage collection off
+
+    gcp = GCPolicy()
+    gcp.start()
+
     # Begin streaming data
     
+    persist.start()
+    reporter.start()
     service.read_data(getData)
 
     # actual while loop
     logger.info('Start experiment')
     
-    while sampleCount < (td * fs): 
+    while td <= 0 or sampleCount < (td * fs): # td <= 0: record until ^C
                     
         # energize calibration coil
         
@@ -183,90 +270,105 @@ def main(p, logger): #@@ use logging module
             coil.go()
             onceCoil = False
             
-        # grab data from queue until queue is empty
+        # grab all pending samples from the ring buffer as one block
                       
-        event.wait()
-        tstamps_ = [] # store all time stamps in queue  
-        updateDrops = 1
+        k = ring.wait(tWait)
+        if k == 0:
+            if service.finished:
+                logger.info("end of replay")
+                break
+            continue
+        tDrain = time.perf_counter_ns() - tStart
+        block = ring.pending(k)
+        tArrival = block[-1,-1]
                                           
-        while len(q)>0:
-                
-            sampleCount += 1
-            
-            # remove oldest item in queue
-             
-            data = q.popleft()
-            
-            # show data_frame dictionary keys for first iteration
-            if sampleCount == 0:
-                logger.info(f"keys in dataframe\n{list(data['data_frames'].keys())}")     
-            
-            # keep track of how many items are in the queue
-            
-            if len(q) > 0 and updateDrops: 
-                sDropped += len(q)
-                updateDrops = 0
-
-            # read data from queue                    
-                
-            for sens in range(nRef):
-                rawDataRef[sampleCount,sens] = data['data_frames'][chNames_Ref[sens]]['data']*calib*g # in nT
+        # keep track of how many samples were waiting behind the first one
 
-            for sens in range(nPrim):
-                rawDataPrim[sampleCount,sens] = data['data_frames'][chNames_Prim[sens]]['data']*calib*g # in nT
+        sDropped += k - 1
 
-            for i_adc in range(nADC):
-                rawDataADC[sampleCount,i_adc] = data['data_frames'][ADCnames[i_adc]]['data']*calib_ADC
-            
-            # get timestamp & store it   
-            
-            timestamp = data['timestamp']/25*1e3  #api uses a sampling rate of 25MHz
+        # store the block                    
+                
+        sampleCount += k
+        rawTap.append(block)
             
-            if t0 is None:
-                t0 = timestamp / fs
-                init = time.perf_counter_ns()
+        # get timestamps & store them   
             
-            tstamps_.append(timestamp/fs - t0) # for printing
+        timestamps = block[:,0]/25*1e3  #api uses a sampling rate of 25MHz
+        timestamp = timestamps[-1]
+
+        counters.samples = sampleCount + 1
+        counters.lastTick = block[-1,0]
+        if counters.firstTick is None:
+            counters.firstTick = block[0,0]
             
-            t_arr[sampleCount] = (timestamp/fs) - t0
+        if t0 is None:
+            t0 = timestamps[0] / fs
+            init = time.perf_counter_ns()
             
-            # filter every sample measured by the reference sensors if selected
+        # filter every sample measured by the reference sensors if selected
             
-            if runDFC > 0:
-                ref_filt = filter_ref(rawDataRef[sampleCount,:])
+        if runDFC > 0:
+            filt = filter_ref.process_block(block[:,decoder.sRef])
+            ref_filt = filt[-1]
+            if predictor is not None:
+                predictor.update(filt, sampleCount)
+            tFilt = time.perf_counter_ns() - tStart
         
-        # Update DFC counter 
+        # decide if a compensation update is due, and if so update DFC counter 
         
-        dfcC +=1
-        t_DFC[dfcC] = timestamp/fs -t0
+        doUpdate = runDFC > 0 and scheduler(sampleCount)
+
+        if doUpdate:
+            dfcC +=1
+            counters.updates = dfcC + 1
+            t_DFC[0] = timestamp/fs -t0, sampleCount
+            dfcTap.append(t_DFC)
                                         
-        # clear event lock so that new items can be placed in the queue 
+        # release the block so that the callback can reuse its rows 
         
-        event.clear()
+        ring.release(k)
         
-        # print elapsed time
-            
-        if sampleCount %100 == 0:                
-            print(sampleCount, tstamps_, t_DFC[dfcC]) 
-                                                  
         # do DFC
                 
-        if runDFC > 0:
+        if doUpdate:
          
-            # compute compensation matrix using tensor multiplication
+            # compute compensation fields (x, y; sign included) for the selected sensors
             
-            compM_ = tl.tenalg.mode_dot(rotMat[:,:, selInArray], ref_filt, mode=1).T
+            if predictor is not None:
+                ref_filt = predictor.predict(sampleCount)
+
+            compM_ = kernel(ref_filt)
+            tComp = time.perf_counter_ns() - tStart
                 
             # add compensation fields to correct CAPE effects
             # 1. build a dictionary of the form {chassisID: [(sensorID, x field, y field, z field),...]}
                  # no z field compensation is done because the code assumes operation mode is set to closed loop  
             
-            sensor_dict = {i: [(cs[1], -comp[0], -comp[1], None) for cs, comp in zip(selCSs,compM_) if cs[0]==i] for i in chassID}
+            if deadband is None:
+                sensor_dict = payload(compM_)
+            else:
+                sensor_dict = payload(compM_, deadband(compM_, sampleCount))
+            tPayload = time.perf_counter_ns() - tStart
             
             # call API function to change the fields
             
-            service.adjust_fields(sensor_dict)
+            if sensor_dict:
+                dispatch(sensor_dict)
+
+            lat[0] = tArrival, tDrain, tFilt, tComp, tPayload, time.perf_counter_ns() - tStart
+            latTap.append(lat)
+            counters.addLatency(lat[0,-1] - tArrival)
+
+            if predictor is not None:
+                predictor.observeLatency(lat[0,-1] - tArrival)
             
+        dfcStats.record(time.perf_counter_ns() - tStart - tDrain, k)
+
+        # collect young garbage if no new samples are waiting
+
+        if ring.available() == 0:
+            gcp.idle()
+
         # ^C to quit the program
                         
         if flgControlC:
@@ -275,6 +377,8 @@ def main(p, logger): #@@ use logging module
 
     # Out of the while loop.
 
+    gcp.stop()
+
 
     #### ----------------------------------------------------------- ####
     #                       RESET/STOP CALLS                            # 
@@ -284,8 +388,8 @@ def main(p, logger): #@@ use logging module
 
     if s_sens.runDFC > 0:
     
-        sensor_dict = {i: [(cs[1], 0, 0, 0) for cs in selCSs if cs[0]==i] for i in chassID}
-        service.adjust_fields(sensor_dict)
+        dispatch.close()
+        service.adjust_fields(payload.zeros())
         
     # stop getdata callback
     
@@ -295,6 +399,20 @@ def main(p, logger): #@@ use logging module
     for c in s_sens.ADCchas:
         service.stop_adc(c)
 
+    # drain the taps and flush the recorders
+
+    reporter.stop()
+    persist.stop()
+    for tap in taps:
+        tap.rec.close()
+
+    nRows = rec.nRows if td <= 0 else min(rec.nRows, int(td*fs)+1)
+
+    # look for samples the api never delivered, using the raw timestamps
+
+    gapMask, gapPos, gapMissing = findGaps(openStream(rec.fileName, rec.nCols, nRows)[:,0], fs)
+    nMissing = int(gapMissing[gapMissing > 0].sum())
+
     # Print total elapsed time & DFC stats
     
     endT = (time.perf_counter_ns()-init)
@@ -302,7 +420,26 @@ def main(p, logger): #@@ use logging module
     logger.info("------------------------------------------------------------\n")
     logger.info(f"elapsed time (ms): {endT*1e-6}")
     logger.info(f"elapsed time according to FL (ms): {timestamp / 1000 - t0}")
-    logger.info(f"dropped samples: {sDropped} out of {sampleCount} samples. Proportion %{100*sDropped/sampleCount}")
+    logger.info(f"backlog samples: {sDropped} out of {sampleCount} samples. Proportion %{100*sDropped/sampleCount}")
+    logger.info(f"missing samples: {nMissing} in {len(gapPos)} gaps. Drop rate %{100*nMissing/max(nRows+nMissing,1)}")
+    logger.info(f"ring buffer overflows: {ring.overflow}")
+    logger.info(gcp.summary())
+    for stats in [acqStats, dfcStats] + [tap.stats for tap in taps]:
+        logger.info(stats.summary())
+    logger.info(f"tap overflows: {[tap.overflow for tap in taps]}")
+    if runDFC > 0:
+        logger.info(f"DFC updates: {dfcC+1} in {sampleCount+1} samples, target rate {p.DFCRate} Hz, missed {scheduler.missed}")
+        logger.info(dispatch.summary())
+        latStats = stageStats(openStream(recLat.fileName, recLat.nCols))
+        logger.info(f"DFC loop latency per stage\n{formatStageStats(latStats)}")
+        if predictor is not None:
+            predStats = predictor.stats()
+            logger.info(f"predictor residuals (nT) over {predStats['n']} forecasts, horizon {predStats['horizon']:.2f} samples:\n"
+                        f"rms {predStats['rms']}, rms without prediction {predStats['rmsHold']}, max {predStats['max']}")
+        if deadband is not None:
+            logger.info(f"deadband {p.deadband} nT: adjust_fields calls {deadband.calls}, saved {deadband.callsSaved}; "
+                        f"sensor entries {deadband.entries}, saved {deadband.entriesSaved}")
+    logger.info(f"recorder chunks written: {rec.chunksWritten}, pool misses: {rec.poolMisses}")
     logger.info("------------------------------------------------------------\n")
     
     # deactivate coil
@@ -322,17 +459,41 @@ def main(p, logger): #@@ use logging module
     #                         SAVE VARIABLES                            # 
     #### ----------------------------------------------------------- ####
 
-    # recorded data-related instance
+    # recorded data-related instance. The raw data stay in the stream files;
+    # only their layout is pickled, and attachStream() maps them back lazily
     
-    s_data.rawDataADC = rawDataADC[:int(td*fs)+1,:]
-    s_data.rawDataPrim = rawDataPrim[:int(td*fs)+1,:]
-    s_data.rawDataRef = rawDataRef[:int(td*fs)+1,:]
-    s_data.tArray = t_arr[:int(td*fs)+1]
+    s_data.streams = {os.path.basename(rec.fileName): {'nCols': rec.nCols, 'nRows': nRows,
+        'fields': {'tTicks': (0, 1),
+                   'rawDataRef': (decoder.sRef.start, decoder.sRef.stop),
+                   'rawDataPrim': (decoder.sPrim.start, decoder.sPrim.stop),
+                   'rawDataADC': (decoder.sADC.start, decoder.sADC.stop),
+                   'tArrival': (decoder.nCols, ring.nCols)}}}
     s_data.FZ_coeffs = fzCoeffs
     s_data.FZ_time = fztime
+    s_data.filterDelay = filter_ref.delay
+    s_data.ringOverflow = ring.overflow
+    s_data.tapOverflow = [tap.overflow for tap in taps]
+    if p.replay:
+        s_data.replayOf = p.replay
+    s_data.rssGrowth = gcp.rss1 - gcp.rss0
+    s_data.gapPos = gapPos
+    s_data.gapMissing = gapMissing
     if s_sens.runDFC > 0:
         s_data.sDropped = sDropped
-        s_data.t_DFC = t_DFC[:int(td*fs)+1]
+        if deadband is not None:
+            s_data.callsSaved = deadband.callsSaved
+            s_data.entriesSaved = deadband.entriesSaved
+        s_data.streams[os.path.basename(recDFC.fileName)] = {'nCols': 2, 'nRows': recDFC.nRows,
+            'fields': {'t_DFC': (0, 1), 'i_DFC': (1, 2)}}
+        s_data.streams[os.path.basename(recDispatch.fileName)] = {'nCols': recDispatch.nCols, 'nRows': recDispatch.nRows,
+            'fields': {'dispatchJoin': (0, 1), 'dispatchChass': (1, recDispatch.nCols)}}
+        s_data.dispatchChassID = chassID
+        s_data.streams[os.path.basename(recLat.fileName)] = {'nCols': recLat.nCols, 'nRows': recLat.nRows,
+            'fields': {'stageStamps': (0, recLat.nCols)}}
+        s_data.stageNames = STAGES
+        s_data.latencyStats = latStats
+        if predictor is not None:
+            s_data.predictorStats = predStats
         
     # array geometry-related instance
 
@@ -348,15 +509,26 @@ def main(p, logger): #@@ use logging module
     savePickle(s_sens, p.sPath +  "_sens.pkl")
     savePickle(s_geom, p.sPath +  "_geom.pkl")
 
+    attachStream(s_data, os.path.dirname(p.sPath))
+
     logger.info("done.")
 
     #### ----------------------------------------------------------- ####
     #                         CONVERT TO .FIF                           # 
     #### ----------------------------------------------------------- ####
 
-    logger.info("\nsaving raw data to .fif file...") 
-    npy2fif(s_data, s_sens, s_geom, filter_ref, p.sPath)
-    logger.info("done.") 
+    # either hand the conversion to a detached worker (see convert_worker.py),
+    # or do it here
+
+    if p.convert and p.background:
+        job = submitJob(p.sPath, p.FilterType)
+        logger.info(f"\n.fif conversion queued: {job}\ncheck progress with: convert_worker.py status")
+    elif p.convert:
+        logger.info("\nsaving raw data to .fif file...") 
+        npy2fif(s_data, s_sens, s_geom, filter_ref, p.sPath)
+        logger.info("done.") 
+
+    return s_data
     
        
                 
@@ -374,9 +546,19 @@ if __name__ == "__main__":
     p.register("saveName", 's', Str(), arghelp ="NAME", help = "prefix name to save data.")
     p.register("savePath", None, Dirname(create = True), arghelp = "DIR", help = "Path to save data.")
     p.register("runDFC", 'd', Int(), default = 0, arghelp = "N", help = "0 (noDFC, default), 1 (refDFC), or 2 (primDFC).")
+    p.register("DFCRate", None, Float(), default = 0, arghelp = "HZ", help = "Compensation update rate in Hz, on the sample clock. 0 (default) updates after every drain.")
+    p.register("predictor", None, Str(), default = 'none', arghelp = "TYPE", help = "Forecast the refs at the time DFC is applied: none (default), linear or ar.")
     p.register("coilID", 'C', Int(), default = -1, arghelp = "N", help = "Calibrator coil id. Default none (-1).")
-    p.register("duration", 't', Float(), default = 0, arghelp = "DUR", help = "Length of recording in seconds.")
+    p.register("duration", 't', Float(), default = 0, arghelp = "DUR", help = "Length of recording in seconds. 0 records until ^C.")
     p.register("closedLoop", None, Bool(), default = True, help = "Whether to use closed loop, default true.")
+    p.register("parallelDispatch", None, Bool(), default = False, help = "Send compensation values to each chassis concurrently, default false.")
+    p.register("convert", None, Bool(), default = True, help = "Convert the recording to .fif at the end, default true.")
+    p.register("background", None, Bool(), default = False, help = "Convert to .fif in a background process, default false.\nUse convert_worker.py status to follow the conversions.")
+    p.register("deadband", None, Float(), default = 0, arghelp = "NT", help = "Only send a sensor's compensation when its x or y field moved more than NT nT. Default 0 (always send).")
+    p.register("replay", None, Str(), default = '', arghelp = "PATH", help = "Replay the recording PATH (without _data.pkl) instead of connecting to the chassis.")
+    p.register("playbackSpeed", None, Float(), default = 1, arghelp = "X", help = "With --replay, replay X times faster than real time; 0 is as fast as possible. Default 1.")
+    p.register("playbackClock", None, Str(), default = 'arrival', arghelp = "CLOCK", help = "With --replay, pace the samples by their recorded arrival times (arrival, default) or timestamps (ticks).")
+    p.register("maxStale", None, Float(), default = .1, arghelp = "SEC", help = "With a deadband, resend a sensor after SEC seconds without an update. Default .1.")
 
    
     help_preset = "use presets for channel selection.\n0 = don't use presets.\n1 = DFC to all available channels in array\n2 = DFC in checkerboard fashion in grid\n"
@@ -395,9 +577,11 @@ if __name__ == "__main__":
     
     # Sanity checks
 
-    if not p.ipList:
+    if not p.ipList and not p.replay:
         p.err("--ip is required")
-    p.ip_list = p.ipList.split(',')
+    if FLService is None and not p.replay:
+        p.err("the fieldline package is required unless --replay is used")
+    p.ip_list = p.ipList.split(',') if p.ipList else []
 
     if not p.saveName:
         p.saveName = 'test'
@@ -447,4 +631,7 @@ if __name__ == "__main__":
     main(p,logger)
     
     logger.info("exit")
+    if logger.handler.dropped:
+        print(f"log records dropped: {logger.handler.dropped}")
+    stop_logging(logger)
     sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,7 @@
+# asv imports the benchmark files as a package; make common.py importable
+# the same way as when they are run as scripts
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
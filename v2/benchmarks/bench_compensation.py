@@ -0,0 +1,31 @@
+"""Compensation fields: tensorly mode_dot on the fancy-indexed rotMat vs
+the precomputed CompensationKernel."""
+
+import numpy as np
+import tensorly as tl
+from common import run
+
+from compensation import CompensationKernel
+
+
+class TimeCompensation:
+
+    params = [59, 512]
+    param_names = ['nSens']
+
+    def setup(self, nSens):
+        rng = np.random.default_rng(0)
+        self.rotMat = rng.standard_normal((3, 3, nSens))
+        self.selInArray = np.arange(nSens)
+        self.ref_filt = rng.standard_normal(3)
+        self.kernel = CompensationKernel(self.rotMat, self.selInArray)
+
+    def time_mode_dot(self, nSens):
+        compM_ = tl.tenalg.mode_dot(self.rotMat[:,:, self.selInArray], self.ref_filt, mode=1).T
+
+    def time_kernel(self, nSens):
+        self.kernel(self.ref_filt)
+
+
+if __name__ == '__main__':
+    run(TimeCompensation)
@@ -0,0 +1,42 @@
+"""Per-frame decode cost: the original per-channel loops vs FrameDecoder."""
+
+import numpy as np
+from common import chanNames, makeFrame, run
+
+from constants import g, calib_ADC
+from frames import FrameDecoder
+
+calib = 3.52e-15
+
+
+class TimeFrameDecode:
+
+    params = [59, 128, 256]
+    param_names = ['nChan']
+
+    def setup(self, nChan):
+        self.chNames_Ref, self.chNames_Prim, self.ADCnames = chanNames(nChan)
+        names = self.chNames_Ref + self.chNames_Prim + self.ADCnames
+        self.data = makeFrame(names, timestamp=123456789)
+        self.decoder = FrameDecoder(self.chNames_Ref, self.chNames_Prim, self.ADCnames, calib)
+        self.rawDataRef = np.empty((1, len(self.chNames_Ref)))
+        self.rawDataPrim = np.empty((1, len(self.chNames_Prim)))
+        self.rawDataADC = np.empty((1, len(self.ADCnames)))
+
+    def time_loops(self, nChan):
+        # the per-sample decode as written in DFC_7x8.main before FrameDecoder
+        data = self.data
+        for sens in range(len(self.chNames_Ref)):
+            self.rawDataRef[0, sens] = data['data_frames'][self.chNames_Ref[sens]]['data']*calib*g
+        for sens in range(len(self.chNames_Prim)):
+            self.rawDataPrim[0, sens] = data['data_frames'][self.chNames_Prim[sens]]['data']*calib*g
+        for i_adc in range(len(self.ADCnames)):
+            self.rawDataADC[0, i_adc] = data['data_frames'][self.ADCnames[i_adc]]['data']*calib_ADC
+        timestamp = data['timestamp']
+
+    def time_decoder(self, nChan):
+        self.decoder(self.data)
+
+
+if __name__ == '__main__':
+    run(TimeFrameDecode)
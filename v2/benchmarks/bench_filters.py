@@ -0,0 +1,96 @@
+"""Reference filter cost per sample: one __call__ per sample vs
+process_block over a drained block, for every filter type, and the
+reprocessing of a whole recording."""
+
+import numpy as np
+from scipy import signal
+from common import run
+
+from filters import nofilt, ema, cheby2, elliptic, bessel, cascade, minphase
+
+blockLen = 10   # samples per drained block
+nRef = 3        # reference sensors
+
+makeFilter = {'nofilt': lambda n: nofilt(n),
+              'ema': lambda n: ema(n, .03),
+              'cheby2': lambda n: cheby2(n, 13),
+              'elliptic': lambda n: elliptic(n, 13),
+              'bessel': lambda n: bessel(n, 13),
+              'cascade': lambda n: cascade(n, 13),
+              'minphase': lambda n: minphase(n, 13)}
+
+
+class TimeFilterStep:
+
+    params = [list(makeFilter), [3, 59, 256]]
+    param_names = ['filter', 'nChan']
+
+    def setup(self, filterName, nChan):
+        self.filt = makeFilter[filterName](nChan)
+        self.filt.restart()
+        self.x = np.random.default_rng(0).standard_normal((blockLen, nChan))
+
+    def time_call(self, filterName, nChan):
+        self.filt(self.x[0])
+
+    def time_block(self, filterName, nChan):
+        self.filt.process_block(self.x)
+
+
+class TimeIIRStep:
+    """cheby2 per-sample step: the b/a transposed direct form loop over
+    channels and order vs the second-order sections."""
+
+    params = [3, 59, 256]
+    param_names = ['nChan']
+
+    def setup(self, nChan):
+        self.b, self.a = signal.cheby2(10, 60, 13, fs=1000)
+        self.d = np.zeros((nChan, 10))
+        self.filt = cheby2(nChan, 13)
+        self.x = np.random.default_rng(0).standard_normal(nChan)
+
+    def time_directForm(self, nChan):
+        # as written in cheby2.__call__ before the sections
+        N, a, b = 10, self.a, self.b
+        arr = self.x
+        r = np.empty(nChan)
+        for j in range(nChan):
+            x = arr[j]
+            d = self.d[j]
+            y = b[0] * x + d[0]
+            for i in range(N-1):
+                d[i] = b[i+1] * x - a[i+1] * y + d[i+1]
+            d[N-1] = b[N] * x - a[N] * y
+            r[j] = y
+
+    def time_sections(self, nChan):
+        self.filt(self.x)
+
+
+class TimeReprocess:
+    """Filtering a 10 s recording of the refs: one __call__ per sample vs
+    a single process_block. That both give the same result, bit for bit,
+    is checked by test/testFilters.py."""
+
+    params = list(makeFilter)
+    param_names = ['filter']
+
+    nSamples = 10000
+
+    def setup(self, filterName):
+        self.filt = makeFilter[filterName](nRef)
+        self.x = np.random.default_rng(0).standard_normal((self.nSamples, nRef)) * 100
+
+    def time_calls(self, filterName):
+        self.filt.restart()
+        return np.array([self.filt(row) for row in self.x])
+
+    def time_block(self, filterName):
+        self.filt.restart()
+        return self.filt.process_block(self.x)
+
+
+if __name__ == '__main__':
+    run(TimeFilterStep, TimeIIRStep, number=500)
+    run(TimeReprocess, number=2)
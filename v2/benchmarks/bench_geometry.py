@@ -0,0 +1,15 @@
+"""Loading the array geometry (cell positions and sensor axes)."""
+
+from common import run
+
+from sensors import extractArrayInfo
+
+
+class TimeGeometry:
+
+    def time_extractArrayInfo(self):
+        extractArrayInfo()
+
+
+if __name__ == '__main__':
+    run(TimeGeometry, number=20)
@@ -0,0 +1,86 @@
+"""Conversion of a recording to .fif, for arrays of increasing size, and
+the offline filtering of the refs."""
+
+import os
+import logging
+import tempfile
+import mne
+import numpy as np
+from common import run, syntheticArray
+
+from constants import struct, fs
+from frames import tickRate
+from filters import ema, cheby2, elliptic
+from npy2fif_7x8 import npy2fif, filterRefSens
+
+nSamples = 2000
+
+
+class TimeNpy2fif:
+
+    params = [59, 128, 256]
+    param_names = ['nChan']
+
+    timeout = 120
+
+    def setup(self, nChan):
+        mne.set_log_level('WARNING')
+        logger = logging.getLogger('DFCbench')
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+
+        self.s_sens, (cellCoords, rotMat) = syntheticArray(nChan, logger)
+        self.s_geom = struct()
+        self.s_geom.cell_coords = cellCoords
+        self.s_geom.rotMat = rotMat
+
+        rng = np.random.default_rng(0)
+        self.s_data = struct()
+        self.s_data.tTicks = np.arange(nSamples) * (tickRate / fs)
+        self.s_data.rawDataRef = rng.standard_normal((nSamples, len(self.s_sens.refList)))
+        self.s_data.rawDataPrim = rng.standard_normal((nSamples, len(self.s_sens.primList)))
+        self.s_data.rawDataADC = rng.standard_normal((nSamples, len(self.s_sens.ADCchas)))
+
+        self.filt = cheby2(len(self.s_sens.refList), 13)
+        self.dir = tempfile.TemporaryDirectory()
+
+    def teardown(self, nChan):
+        self.dir.cleanup()
+
+    def time_npy2fif(self, nChan):
+        self.filt.restart()
+        npy2fif(self.s_data, self.s_sens, self.s_geom, self.filt, os.path.join(self.dir.name, 'bench'))
+
+
+class TimeFilterRefSens:
+    """Offline filtering of 10 minutes of refs: the per-sample loop as the
+    online filter runs vs filterRefSens. That they give the same result is
+    checked by test/testFilters.py."""
+
+    params = ['ema', 'cheby2', 'elliptic']
+    param_names = ['filter']
+
+    nSamples = 600 * fs
+
+    def setup(self, filterName):
+        self.filt = {'ema': lambda: ema(3, .03),
+                     'cheby2': lambda: cheby2(3, 13),
+                     'elliptic': lambda: elliptic(3, 13)}[filterName]()
+        self.s_data = struct()
+        self.s_data.rawDataRef = np.random.default_rng(0).standard_normal((self.nSamples, 3)) * 100
+
+    def time_loop(self, filterName):
+        # as filterRefSens was written before the block filters
+        self.filt.restart()
+        filtDataRef = np.empty(self.s_data.rawDataRef.shape)
+        for n in range(self.s_data.rawDataRef.shape[0]):
+            filtDataRef[n,:] = self.filt(self.s_data.rawDataRef[n,:])
+        return filtDataRef
+
+    def time_filterRefSens(self, filterName):
+        return filterRefSens(self.s_data, self.filt)
+
+
+if __name__ == '__main__':
+    run(TimeNpy2fif, number=1)
+    run(TimeFilterRefSens, number=1)
@@ -0,0 +1,31 @@
+"""adjust_fields() payload build time: the per-chassis comprehension vs
+the compiled PayloadBuilder."""
+
+import numpy as np
+from common import run
+
+from constants import nSensPC
+from compensation import PayloadBuilder
+
+
+class TimePayload:
+
+    params = [4, 8, 16]
+    param_names = ['nChass']
+
+    def setup(self, nChass):
+        self.chassID = list(range(nChass))
+        self.selCSs = np.array([(c, s) for c in self.chassID for s in range(1, nSensPC + 1)])
+        self.compM_ = np.random.default_rng(0).standard_normal((len(self.selCSs), 2))
+        self.builder = PayloadBuilder(self.selCSs, self.chassID)
+
+    def time_comprehension(self, nChass):
+        # as written in DFC_7x8.main before PayloadBuilder
+        sensor_dict = {i: [(cs[1], comp[0], comp[1], None) for cs, comp in zip(self.selCSs, self.compM_) if cs[0]==i] for i in self.chassID}
+
+    def time_builder(self, nChass):
+        self.builder(self.compM_)
+
+
+if __name__ == '__main__':
+    run(TimePayload, number=200)
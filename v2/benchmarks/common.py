@@ -0,0 +1,155 @@
+"""Helpers shared by the benchmarks.
+
+    The benchmark classes follow the asv conventions (params, setup,
+    time_* methods), so they can be collected by asv. Each benchmark
+    file can also be run on its own, e.g.
+
+        python benchmarks/bench_decode.py
+
+    which times every time_* method with timeit and prints the cost per
+    call in microseconds, next to the stored baseline (baseline.json) and
+    the ratio to it; calls more than 25% slower than the baseline are
+    flagged. run_all.py runs every benchmark file. With --save, the new
+    timings replace the baseline.
+
+    The baseline was recorded on one machine; record a new one (run_all.py
+    --save) before comparing on another.
+"""
+
+import os
+import sys
+import json
+import timeit
+import itertools
+import numpy as np
+
+# make the v2 modules importable when run from anywhere
+
+v2_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if v2_path not in sys.path:
+    sys.path.insert(0, v2_path)
+
+from constants import nSensPC
+from sensors import SensorManager, extractArrayInfo, slist2clist, slist2sdict
+
+baselineFile = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+regression = 1.25   # flag calls this much slower than the baseline
+
+nRefBench = 3   # reference sensors in every synthetic array
+
+
+def chanNames(nChan, closedLoop=True):
+    """Return (chNames_Ref, chNames_Prim, ADCnames) for a synthetic array
+    of nChan magnetometers spread over as many chassis as needed, with one
+    ADC channel per chassis."""
+
+    suffix = 50 if closedLoop else 28
+    cs = [(i // nSensPC, i % nSensPC + 1) for i in range(nChan)]
+    names = [f"{c:02d}:{s:02d}:{suffix}" for c, s in cs]
+    nChass = cs[-1][0] + 1
+    ADCnames = [f"{c:02d}:00:0" for c in range(nChass)]
+
+    return names[:nRefBench], names[nRefBench:], ADCnames
+
+
+def makeFrame(names, timestamp=0, rng=None):
+    "Return a FieldLine-shaped frame with random integer data for names."
+
+    if rng is None:
+        rng = np.random.default_rng(0)
+    values = rng.integers(-2**20, 2**20, len(names))
+    frames = {n: {'data': int(v)} for n, v in zip(names, values)}
+
+    return {'timestamp': timestamp, 'data_frames': frames}
+
+
+def syntheticArray(nChan, logger, runDFC=2):
+    """Return (s_sens, geometry) for a synthetic array of nChan magnetometers
+    laid out as chanNames() does, with DFC on every sensor. The geometry
+    (cellCoords, rotMat) repeats the 7x8 array's cells as often as needed."""
+
+    names = chanNames(nChan)
+    cs = [(int(n[:2]), int(n[3:5])) for n in names[0] + names[1]]
+
+    s_sens = SensorManager()
+    s_sens.logger = logger
+    s_sens.sensID = cs
+    s_sens.refList = cs[:nRefBench]
+    s_sens.primList = cs[nRefBench:]
+    s_sens.sensors = cs
+    s_sens.chassID = slist2clist(cs)
+    s_sens.sdict = slist2sdict(cs)
+    s_sens.chNames_Ref, s_sens.chNames_Prim, s_sens.ADCnames = names
+    s_sens.chNs = names[0] + names[1]
+    s_sens.ADCchas = s_sens.chassID
+    s_sens.calib = 3.52e-15
+    s_sens.runDFC = runDFC
+    s_sens.refInArray = np.arange(nRefBench)
+    s_sens.primInArray = np.arange(nRefBench, nChan)
+    s_sens.selInChass = list(range(nChan))
+    s_sens.selInArray = np.arange(nChan)
+    s_sens.selCSs = np.array(cs)
+
+    cellCoords, rotMat = extractArrayInfo()
+    cells = np.arange(nChan) % rotMat.shape[2]
+
+    return s_sens, (cellCoords[cells], rotMat[:, :, cells])
+
+
+def loadBaseline():
+    if os.path.exists(baselineFile):
+        with open(baselineFile) as f:
+            return json.load(f)
+    return {}
+
+
+def saveBaseline(timings):
+    "Merge timings (label: us per call) into the baseline file."
+
+    baseline = loadBaseline()
+    baseline.update(timings)
+    with open(baselineFile, 'w') as f:
+        json.dump(dict(sorted(baseline.items())), f, indent=1)
+
+
+def run(*classes, number=2000):
+    """Time every time_* method of classes, for every parameter value
+    (or combination of values, if the class has several parameters), and
+    compare with the baseline. Returns {label: us per call}."""
+
+    baseline = loadBaseline()
+    timings = {}
+
+    for cls in classes:
+        params = getattr(cls, 'params', None)
+        if params is None:
+            combos = [()]
+        elif len(getattr(cls, 'param_names', [])) > 1:
+            combos = list(itertools.product(*params))
+        else:
+            combos = [(param,) for param in params]
+
+        for args in combos:
+            bench = cls()
+            if hasattr(bench, 'setup'):
+                bench.setup(*args)
+            for name in sorted(dir(bench)):
+                if not name.startswith('time_'):
+                    continue
+                f = getattr(bench, name)
+                t = min(timeit.repeat(lambda: f(*args), number=number, repeat=5)) / number * 1e6
+                label = f"{cls.__name__}.{name}" + (f"({', '.join(map(str, args))})" if args else "")
+                timings[label] = t
+
+                line = f"{label:<50s} {t:10.2f} us"
+                if label in baseline:
+                    ratio = t / baseline[label]
+                    line += f"   baseline {baseline[label]:10.2f} us  x{ratio:.2f}"
+                    if ratio > regression:
+                        line += "  REGRESSION"
+                print(line, flush=True)
+
+    if '--save' in sys.argv:
+        saveBaseline(timings)
+
+    return timings
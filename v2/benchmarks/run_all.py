@@ -0,0 +1,20 @@
+#! /usr/bin/env python
+
+"""Run every benchmark file and compare with the stored baseline.
+
+    Usage:
+        python benchmarks/run_all.py           # compare with baseline.json
+        python benchmarks/run_all.py --save    # and replace the baseline
+"""
+
+import os
+import glob
+import runpy
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+if __name__ == '__main__':
+
+    for f in sorted(glob.glob(os.path.join(here, 'bench_*.py'))):
+        print(f"\n{os.path.basename(f)}")
+        runpy.run_path(f, run_name='__main__')
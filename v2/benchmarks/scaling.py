@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+
+"""How the DFC loop scales with the size of the array.
+
+    For each array size and filter type, a synthetic array of that many
+    magnetometers (3 refs, the rest prims, one ADC per chassis, DFC on
+    every sensor) is run through DFC_7x8.main, fed by a SyntheticService:
+    a ReplayService (see replay.py) whose samples are generated instead
+    of loaded from a recording. The samples keep the 1 kHz timestamps
+    and are delivered at increasing rates, 1, 2, 4, ... kHz, until the
+    loop stops keeping up.
+
+    For every rate it reports the rate actually delivered, the drop rate
+    (samples that never reached the recording) and the arrival to
+    adjust_fields() latency percentiles; the last rate with no drops is
+    the maximum sustainable rate for that array. Note that the frames are
+    generated in the same process, so at the highest rates the generator
+    competes with the loop for the interpreter.
+
+    Usage:
+        python benchmarks/scaling.py
+        python benchmarks/scaling.py --chans 59 256 --filters nofilt cheby2 --rates 1000 4000
+"""
+
+import io
+import logging
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+from common import syntheticArray
+from constants import struct, fs
+from frames import tickRate
+from replay import ReplayService
+import DFC_7x8
+
+filterTypes = {'nofilt': ('n',),
+               'ema': ('e', .03),
+               'cheby2': ('c', 13, 10, 60),
+               'elliptic': ('E', 13, 10, .1, 60)}
+
+
+class SyntheticService(ReplayService):
+
+    def __init__(self, s_sens, nSamples, rate, seed=0):
+        """Deliver nSamples random samples for s_sens at rate samples/s.
+
+        Parameters:
+
+            s_sens : SensorManager
+                Array layout, see syntheticArray().
+
+            nSamples : int
+                Number of samples.
+
+            rate : float
+                Delivery rate in samples per second; the timestamps stay
+                on the fs sample clock.
+        """
+
+        rng = np.random.default_rng(seed)
+        scale = s_sens.calib * 1e9
+
+        s_data = struct()
+        s_data.tTicks = np.arange(nSamples) * (tickRate / fs)
+        s_data.rawDataRef = rng.integers(-2**20, 2**20, (nSamples, len(s_sens.chNames_Ref))) * scale
+        s_data.rawDataPrim = rng.integers(-2**20, 2**20, (nSamples, len(s_sens.chNames_Prim))) * scale
+        s_data.rawDataADC = np.zeros((nSamples, len(s_sens.ADCnames)))
+
+        self.load(s_data, s_sens, speed=rate / fs, clock='ticks')
+
+
+def runOnce(nChan, filterName, rate, duration, logger):
+    """Run DFC_7x8.main once; return (delivered rate, drop rate %,
+    arrival->adjust latency (p50, p90, p99, max) in ms)."""
+
+    s_sens, geometry = syntheticArray(nChan, logger)
+
+    p = struct()
+    p.runDFC = 2
+    p.FilterType = filterTypes[filterName]
+    p.DFCRate = 0
+    p.predictor = 'none'
+    p.deadband = 0
+    p.maxStale = .1
+    p.parallelDispatch = False
+    p.coilID = -1
+    p.replay = ''
+    p.convert = False
+    p.background = False
+
+    # the loop covers `duration` seconds of the sample clock
+
+    nSamples = int(max(duration * rate, fs)) + 1
+    p.duration = (nSamples - 1) / fs
+    service = SyntheticService(s_sens, nSamples, rate)
+
+    with tempfile.TemporaryDirectory() as d:
+        p.sPath = f"{d}/scale"
+        with contextlib.redirect_stdout(io.StringIO()):
+            s_data = DFC_7x8.main(p, logger, service, s_sens, geometry)
+
+        nRows = s_data.streams['scale_stream.bin']['nRows']
+        latency = s_data.latencyStats[f"{DFC_7x8.STAGES[0]}->{DFC_7x8.STAGES[-1]}"]
+
+    delivered = (service.nDelivered - 1) / service.elapsed
+    drop = 100 * (nSamples - nRows) / nSamples
+
+    return delivered, drop, latency
+
+
+def scaling(chans, filters, rates, duration):
+
+    logger = logging.getLogger('DFCscale')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    print(f"{'chans':>6s} {'filter':>9s} {'rate':>7s} {'delivered':>10s} {'drop %':>7s} "
+          f"{'p50 ms':>8s} {'p90 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+
+    summary = []
+    for nChan in chans:
+        for filterName in filters:
+            best, limit = 0, 'not reached'
+            for rate in rates:
+                delivered, drop, lat = runOnce(nChan, filterName, rate, duration, logger)
+                print(f"{nChan:6d} {filterName:>9s} {rate:7.0f} {delivered:10.0f} {drop:7.2f} "
+                      + " ".join(f"{v:8.3f}" for v in lat), flush=True)
+
+                if drop > 0:
+                    limit = 'drops'
+                    break
+                if delivered < .95 * rate:
+                    limit = 'generator'
+                    break
+                best = rate
+            summary.append((nChan, filterName, best, limit))
+
+    print("\nmaximum sustainable rate (samples/s, no drops), and what stopped the ramp")
+    for nChan, filterName, best, limit in summary:
+        print(f"{nChan:6d} {filterName:>9s} {best:7.0f}  {limit}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="DFC loop scaling with the array size")
+    parser.add_argument("--chans", type=int, nargs='+', default=[59, 128, 256, 512])
+    parser.add_argument("--filters", nargs='+', default=list(filterTypes), choices=list(filterTypes))
+    parser.add_argument("--rates", type=float, nargs='+', default=[1000, 2000, 4000, 8000, 16000])
+    parser.add_argument("--duration", type=float, default=1.5, help="seconds of wall time per rate")
+    args = parser.parse_args()
+
+    scaling(args.chans, args.filters, args.rates, args.duration)
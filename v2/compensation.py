@@ -0,0 +1,243 @@
+"""This module computes the DFC compensation fields.
+
+    For each selected sensor i, the field to apply along its transverse
+    axes is minus the filtered reference field projected onto the sensor's
+    x and y axes,
+
+        comp[i] = -rotMat[:2, :, selInArray[i]] @ ref_filt
+
+    No z compensation is computed, because the sensors are operated in
+    closed loop.
+
+    The fields are sent to the coils with adjust_fields(), which takes a
+    dict of per-chassis lists of (sensorID, x, y, z) tuples; a
+    PayloadBuilder builds that dict from the compensation output, and a
+    Deadband can restrict it to the sensors whose fields have changed.
+    An UpdateScheduler sets how often the fields are sent.
+"""
+
+import numpy as np
+from itertools import repeat, compress
+
+__all__ = ['CompensationKernel', 'PayloadBuilder', 'Deadband', 'UpdateScheduler']
+
+
+class CompensationKernel:
+
+    def __init__(self, rotMat, selInArray):
+        """Precompute the compensation matrix for one run.
+
+        Parameters:
+
+            rotMat : array, shape (3, 3, nSens)
+                Sensor axes, as returned by extractArrayInfo(); rows are
+                the bx, by, bz unit vectors.
+
+            selInArray : array of int
+                Array indices of the sensors DFC is applied to.
+
+        Returns:
+
+            The instance is a callable that maps a filtered reference
+            vector to an (N, 2) array of (x, y) compensation fields,
+            one row per selected sensor.
+        """
+
+        sel = np.asarray(selInArray, dtype=int)
+        self.N = len(sel)
+
+        # (N, 2, 3) transverse-only matrix with the sign folded in, stored
+        # as a contiguous (2N, 3) matrix so each call is a single GEMV
+
+        K = -np.transpose(rotMat[:2, :, sel], (2, 0, 1))
+        self.K = np.ascontiguousarray(K.reshape(2 * self.N, 3))
+
+        self.out = np.empty((self.N, 2))
+        self._flat = self.out.reshape(-1)   # a view of out
+
+    def __call__(self, ref_filt):
+        """
+        Parameter: ref_filt, the filtered reference field (length 3, nT).
+        Returns: self.out, overwritten by the next call.
+        """
+
+        np.dot(self.K, ref_filt, out=self._flat)
+
+        return self.out
+
+
+class PayloadBuilder:
+
+    def __init__(self, selCSs, chassID):
+        """Compile the adjust_fields() payload layout for one run.
+
+        Parameters:
+
+            selCSs : array, shape (N, 2)
+                (chassis, sensor) pairs of the selected sensors, in the
+                same order as the rows of the compensation output.
+
+            chassID : list of int
+                Chassis to include in the payload.
+
+        Returns:
+
+            The instance is a callable that turns an (N, 2) array of
+            compensation fields into a dict of the form
+            {chassisID: [(sensorID, x field, y field, None), ...]}.
+        """
+
+        selCSs = np.asarray(selCSs, dtype=int).reshape(-1, 2)
+        self.chassID = list(chassID)
+
+        # rows of each chassis, in selCSs order; perm groups the rows by
+        # chassis so that one gather puts every chassis in its own slice
+
+        idx = [np.flatnonzero(selCSs[:, 0] == c) for c in self.chassID]
+        self.perm = np.concatenate(idx) if idx else np.empty(0, dtype=int)
+
+        self.layout = []    # (chassisID, start, stop, sensor IDs)
+        start = 0
+        for c, i in zip(self.chassID, idx):
+            self.layout.append((c, start, start + len(i), selCSs[i, 1].tolist()))
+            start += len(i)
+
+    def __call__(self, comp, mask=None):
+        """
+        Parameters:
+
+            comp : array, shape (N, 2)
+                The output of a CompensationKernel.
+
+            mask : boolean array of length N, optional
+                If given, only sensors where mask is True are included,
+                and chassis left without any sensor are omitted.
+
+        Returns: the sensor dict to pass to adjust_fields().
+        """
+
+        x, y = comp[self.perm].T.tolist()
+
+        if mask is None:
+            return {c: list(zip(sIDs, x[a:b], y[a:b], repeat(None, b - a))) for c, a, b, sIDs in self.layout}
+
+        m = mask[self.perm].tolist()
+        d = {}
+        for c, a, b, sIDs in self.layout:
+            l = list(compress(zip(sIDs, x[a:b], y[a:b], repeat(None, b - a)), m[a:b]))
+            if l:
+                d[c] = l
+
+        return d
+
+    def zeros(self):
+        """Return a payload that resets every selected sensor to zero."""
+
+        return {c: [(s, 0, 0, 0) for s in sIDs] for c, a, b, sIDs in self.layout}
+
+
+class Deadband:
+
+    def __init__(self, N, threshold, maxStale):
+        """Decide which sensors need a new compensation value.
+
+        Parameters:
+
+            N : int
+                Number of selected sensors.
+
+            threshold : float
+                Deadband, in nT. A sensor is sent when its x or y field
+                differs from the last value sent by more than this.
+
+            maxStale : int
+                A sensor is also sent when it has not been sent for this
+                many samples.
+
+        Returns:
+
+            The instance is a callable that returns a boolean mask of
+            the sensors to send. It keeps counts of the adjust_fields()
+            calls and sensor entries sent and saved.
+        """
+
+        self.N = N
+        self.threshold = threshold
+        self.maxStale = maxStale
+
+        self.last = np.zeros((N, 2))            # last values sent
+        self.lastSent = np.full(N, -maxStale)   # sample index of last send
+
+        self.calls, self.callsSaved = 0, 0
+        self.entries, self.entriesSaved = 0, 0
+
+    def __call__(self, comp, sampleCount):
+        """
+        Parameters:
+
+            comp : array, shape (N, 2)
+                The current compensation fields.
+
+            sampleCount : int
+                The current sample index.
+
+        Returns: a boolean mask of length N. The sensors it selects are
+        considered sent.
+        """
+
+        send = np.abs(comp - self.last).max(axis=1) > self.threshold
+        send |= (sampleCount - self.lastSent) >= self.maxStale
+
+        self.last[send] = comp[send]
+        self.lastSent[send] = sampleCount
+
+        n = int(np.count_nonzero(send))
+        self.entries += n
+        self.entriesSaved += self.N - n
+        if n > 0:
+            self.calls += 1
+        else:
+            self.callsSaved += 1
+
+        return send
+
+
+class UpdateScheduler:
+
+    def __init__(self, rate, fs):
+        """Schedule compensation updates at a fixed rate on the sample clock.
+
+        Parameters:
+
+            rate : float
+                Target update rate, in Hz. If rate <= 0, every call is
+                due, i.e. one update per drain of the ring buffer.
+
+            fs : int
+                Sampling rate, in Hz.
+
+        Returns:
+
+            The instance is a callable that takes the index of the newest
+            sample and returns True when an update is due.
+        """
+
+        self.period = fs / rate if rate > 0 else 0    # in samples
+        self.next = 0
+        self.missed = 0     # due times skipped because a drain spanned several
+
+    def __call__(self, sampleCount):
+
+        if sampleCount < self.next:
+            return False
+
+        # schedule from the due time, not from now, so the average rate
+        # is exact; skip due times that are already in the past
+
+        self.next += self.period
+        if sampleCount >= self.next and self.period > 0:
+            n = int((sampleCount - self.next) // self.period) + 1
+            self.missed += n
+            self.next += n * self.period
+
+        return True
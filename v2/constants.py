@@ -21,3 +21,5 @@ g = 1e9 # convert tesla to nanotesla
 calib_ADC = 2.980232238769531e-07 # calibration value of adc channel
 fs = 1000 # sampling rate
 
+ringLen = 1000 # ring buffer capacity between the data callback and the DFC loop, in samples
+chunkLen = 1000 # rows per chunk written by the streaming recorder
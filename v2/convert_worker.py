@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+
+"""Convert recorded sessions to .fif in a background process.
+
+    At the end of a run, DFC_7x8.py (with --background) saves the .pkl
+    files, writes a small job file to the job directory and starts this
+    worker detached from the terminal, so the operator can start the next
+    run straight away. The worker converts queued jobs one at a time, in
+    the order they were submitted, and exits when there are none left;
+    only one worker runs at a time.
+
+    Usage:
+        convert_worker.py status    # list queued, running and finished jobs
+        convert_worker.py run       # process queued jobs (started automatically)
+
+    The job directory is ~/.dfc_jobs, or $DFC_JOBS if set.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import pickle
+import logging
+import traceback
+import subprocess
+
+jobDir = os.environ.get('DFC_JOBS', os.path.join(os.path.expanduser('~'), '.dfc_jobs'))
+
+__all__ = ['submitJob', 'listJobs']
+
+
+def writeJob(fileName, job):
+    "Write a job file atomically."
+
+    tmp = fileName + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(job, f, indent=1)
+    os.replace(tmp, fileName)
+
+
+def submitJob(sPath, filterType):
+    """Queue the conversion of the session saved at sPath (the prefix of
+    its .pkl files) and make sure a worker is running. Returns the job
+    file name."""
+
+    os.makedirs(jobDir, exist_ok=True)
+    sPath = os.path.abspath(sPath)
+    fileName = os.path.join(jobDir, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.path.basename(sPath)}.json")
+    writeJob(fileName, {'sPath': sPath, 'filter': list(filterType), 'state': 'queued',
+                        'submitted': time.time()})
+
+    # detach from the acquisition process and its terminal
+
+    worker = os.path.realpath(__file__)
+    with open(os.path.join(jobDir, 'worker.log'), 'a') as log:
+        subprocess.Popen([sys.executable, worker, 'run'], cwd=os.path.dirname(worker),
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+
+    return fileName
+
+
+def listJobs():
+    "Return a list of (job file name, job dict), oldest first."
+
+    if not os.path.isdir(jobDir):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(jobDir)):
+        if name.endswith('.json'):
+            fileName = os.path.join(jobDir, name)
+            try:
+                with open(fileName) as f:
+                    jobs.append((fileName, json.load(f)))
+            except (OSError, ValueError):
+                pass    # being replaced
+
+    return jobs
+
+
+def convert(job):
+    "Load a saved session and write its .fif file."
+
+    from io_dfc import loadPickle
+    from filters import getFilter
+    from npy2fif_7x8 import npy2fif
+
+    sPath = job['sPath']
+
+    # the sensor manager must keep its methods, so it's not loaded with loadPickle()
+
+    s_data = loadPickle(sPath + "_data.pkl")
+    with open(sPath + "_sens.pkl", 'rb') as f:
+        s_sens = pickle.load(f)
+    s_geom = loadPickle(sPath + "_geom.pkl")
+
+    filter_ref = getFilter(s_sens, tuple(job['filter']))
+    npy2fif(s_data, s_sens, s_geom, filter_ref, sPath)
+
+
+def run():
+    "Process queued jobs until there are none left."
+
+    os.makedirs(jobDir, exist_ok=True)
+    lock = open(os.path.join(jobDir, 'worker.lock'), 'w')
+
+    logger = logging.getLogger('DFClog')
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return          # another worker is running
+
+        queued = [(n, j) for n, j in listJobs() if j['state'] == 'queued']
+        for fileName, job in queued:
+            job['state'] = 'running'
+            job['started'] = time.time()
+            job['pid'] = os.getpid()
+            writeJob(fileName, job)
+            print(f"converting {job['sPath']}", flush=True)
+            try:
+                convert(job)
+                job['state'] = 'done'
+            except Exception:
+                job['state'] = 'failed'
+                job['error'] = traceback.format_exc()
+                print(job['error'], flush=True)
+            job['finished'] = time.time()
+            writeJob(fileName, job)
+
+        fcntl.flock(lock, fcntl.LOCK_UN)
+
+        # a job queued after the scan started a worker that found the lock
+        # taken and gave up, so look again before exiting
+
+        if not any(j['state'] == 'queued' for n, j in listJobs()):
+            return
+
+
+def status():
+    "Print the jobs."
+
+    def fmt(t):
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t)) if t else ''
+
+    jobs = listJobs()
+    if not jobs:
+        print(f"no jobs in {jobDir}")
+    for fileName, job in jobs:
+        t = job.get('finished') or job.get('started') or job.get('submitted')
+        print(f"{job['state']:<8s} {fmt(t):<20s} {job['sPath']}")
+        if job['state'] == 'failed':
+            print("         " + job.get('error', '').strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ('run', 'status'):
+        print(f"Usage: {os.path.basename(sys.argv[0])} status|run", file=sys.stderr)
+        sys.exit(1)
+
+    # the worker imports the DFC modules by name
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+    if sys.argv[1] == 'run':
+        run()
+    else:
+        status()
@@ -0,0 +1,109 @@
+"""This module sends compensation payloads to the FieldLine service.
+
+    By default a payload is sent with a single adjust_fields() call that
+    carries every chassis. With parallel=True, the payload is split per
+    chassis and the parts are sent concurrently from a persistent thread
+    pool, one worker per chassis, so that the update latency does not
+    grow with the number of daisy-chained chassis.
+
+    Each update is timed with perf_counter_ns: the join latency (from the
+    first submit until every part has returned, or the duration of the
+    single call) and, in parallel mode, the wall time of each chassis.
+"""
+
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['AdjustDispatcher']
+
+
+class AdjustDispatcher:
+
+    def __init__(self, service, chassID, parallel=False, rec=None):
+        """
+        Parameters:
+
+            service : FLService
+                The service whose adjust_fields() is called.
+
+            chassID : list of int
+                All chassis that may appear in a payload.
+
+            parallel : bool
+                Split payloads per chassis and send them concurrently.
+
+            rec : ChunkRecorder, optional
+                If given, one row per update is appended to it:
+                [join latency, wall time of each chassis in chassID],
+                in ns. Chassis that were not sent are NaN.
+        """
+
+        self.service = service
+        self.chassID = list(chassID)
+        self.parallel = parallel
+        self.rec = rec
+
+        self.col = {c: i + 1 for i, c in enumerate(self.chassID)}
+        self.row = np.full((1, len(self.chassID) + 1), np.nan)
+
+        self.n = 0
+        self.joinSum, self.joinMax = 0, 0
+        self.chassSum = np.zeros(len(self.chassID))
+        self.chassN = np.zeros(len(self.chassID), dtype=int)
+
+        self.pool = None
+        if parallel:
+            self.pool = ThreadPoolExecutor(max_workers=len(self.chassID),
+                                           thread_name_prefix='adjust_fields')
+
+    def _send(self, c, l):
+        t0 = time.perf_counter_ns()
+        self.service.adjust_fields({c: l})
+        return c, time.perf_counter_ns() - t0
+
+    def __call__(self, sensor_dict):
+        """Send sensor_dict, the argument of adjust_fields(), and wait
+        until it has been sent."""
+
+        row = self.row
+        row[:] = np.nan
+
+        t0 = time.perf_counter_ns()
+        if self.parallel:
+            futures = [self.pool.submit(self._send, c, l) for c, l in sensor_dict.items()]
+            for f in futures:
+                c, dt = f.result()
+                i = self.col[c]
+                row[0, i] = dt
+                self.chassSum[i-1] += dt
+                self.chassN[i-1] += 1
+        else:
+            self.service.adjust_fields(sensor_dict)
+        join = time.perf_counter_ns() - t0
+        row[0, 0] = join
+
+        self.n += 1
+        self.joinSum += join
+        self.joinMax = max(self.joinMax, join)
+
+        if self.rec is not None:
+            self.rec.append(row)
+
+    def summary(self):
+        "Return a one-line summary of the latencies, in ms."
+
+        if self.n == 0:
+            return "no adjust_fields calls"
+        s = f"adjust_fields ({'parallel' if self.parallel else 'single call'}): {self.n} updates, " \
+            f"join mean {self.joinSum / self.n * 1e-6:.3f} ms, max {self.joinMax * 1e-6:.3f} ms"
+        if self.parallel:
+            means = [f"{c}: {t / max(n, 1) * 1e-6:.3f}" for c, t, n in zip(self.chassID, self.chassSum, self.chassN)]
+            s += f"; per chassis mean (ms) {', '.join(means)}"
+        return s
+
+    def close(self):
+        "Stop the worker threads."
+
+        if self.pool is not None:
+            self.pool.shutdown()
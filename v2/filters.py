@@ -4,16 +4,134 @@
         ema        Exponential moving average
         cheby2     Chebyshev type II lowpass
         elliptic   Elliptic lowpass
+        bessel     Bessel lowpass (maximally flat group delay)
+        cascade    Cascaded one- and two-pole lowpass sections
+        minphase   Minimum-phase FIR lowpass
         nofilt     No filter
+
+    Every filter delays the refs, and that delay adds to the compensation
+    lag; getFilter() measures the group delay of the filter it builds
+    (see groupDelay) and logs it.
+
+    Every filter is a callable that filters one sample (an array of nChan
+    values) at a time, and has a process_block(x) method that filters a
+    (k, nChan) block of consecutive samples in one call. Both carry the
+    same state: process_block gives bit for bit the result of k calls, so
+    live drains and offline reprocessing can mix them freely.
+
+    scipy.signal takes a large part of the start-up time, so it is only
+    imported when it is needed: to design a filter that is not in the
+    design cache (see designFilter), and when a filter that runs on it is
+    restarted, so that the first block does not pay for the import. ema
+    and nofilt run live in plain numpy and never import it; ema only
+    uses it to reprocess long blocks offline.
 """
 
+import os
 import numpy as np
-from scipy import signal
 from param import Param, propObj
 import sys
 
+# filter designs are cached here, one .npy file per design
+
+cacheDir = os.environ.get('DFC_CACHE', os.path.join(os.path.expanduser('~'), '.dfc_cache'))
+
+cacheVersion = 2 # changed when a design changes, so that stale files are not used
+
+signal = None   # scipy.signal, see loadSignal()
+_sosfilt = None # the compiled loop behind signal.sosfilt, if it passes checkKernel()
+
+
+def checkKernel(signal, kernel):
+    """Return True if kernel, the private compiled loop behind
+    signal.sosfilt, filters in place exactly as sosfilter.process_block
+    calls it, and gives what signal.sosfilt gives. It is not part of the
+    scipy api, so any other signature, dtype or result counts as False."""
+
+    try:
+        sos = np.array([[.2, .3, .1, 1, -.6, .2], [1, -.4, .3, 1, .1, -.3]])
+        x = np.arange(14.).reshape(7, 2) ** 1.5
+        y0, zf = signal.sosfilt(sos, x, axis=0, zi=np.ones((2, 2, 2)))
+
+        y = np.array(x, dtype=float, order='F')
+        zi = np.ones((2, 2, 2))
+        kernel(sos, y.T, zi)
+
+        return np.array_equal(y, y0) and np.array_equal(zi, zf.transpose(2, 0, 1))
+    except Exception:
+        return False
+
+
+def loadSignal():
+    "Import scipy.signal on first use and return it."
+
+    global signal, _sosfilt
+
+    if signal is None:
+        from scipy import signal as s
+        try:
+            from scipy.signal._sosfilt import _sosfilt as kernel
+            if checkKernel(s, kernel):
+                _sosfilt = kernel
+        except ImportError:
+            pass
+        signal = s
+
+    return signal
+
+
+def designFilter(ftype, N, cutoff, dB=None, rp=None, fs=1000, btype='lowpass'):
+    """Return the (nSections, 6) second-order sections of a 'cheby2',
+    'ellip' or 'bessel' design, or the N taps of a 'minphase' FIR design,
+    from the cache in cacheDir if it is there.
+
+    The cache is keyed by (type, order, cutoff, dB, rp, fs, btype) and
+    cacheVersion; a missing design is computed with scipy.signal and
+    saved. The cache is
+    only an optimization: if it cannot be read or written, the design is
+    simply computed.
+    """
+
+    key = f"v{cacheVersion}_{ftype}_N{N}_cutoff{float(cutoff)!r}_dB{dB if dB is None else float(dB)!r}_rp{rp if rp is None else float(rp)!r}_fs{float(fs)!r}_{btype}"
+    fileName = os.path.join(cacheDir, key + '.npy')
+
+    try:
+        return np.load(fileName)
+    except (OSError, ValueError):
+        pass
+
+    signal = loadSignal()
+    if ftype == 'cheby2':
+        sos = signal.cheby2(N, dB, cutoff, fs=fs, btype=btype, output='sos')
+    elif ftype == 'ellip':
+        sos = signal.ellip(N, rp, dB, cutoff, fs=fs, btype=btype, output='sos')
+    elif ftype == 'bessel':
+        sos = signal.bessel(N, cutoff, fs=fs, btype=btype, norm='mag', output='sos')
+    elif ftype == 'minphase':
+        # minimum_phase() returns about the square root of the magnitude of
+        # its input, so give it the prototype convolved with itself: the N
+        # taps that come out have the magnitude of the N tap prototype
+        h = signal.firwin(N, cutoff, fs=fs, pass_zero=btype)
+        sos = signal.minimum_phase(np.convolve(h, h))
+    else:
+        raise ValueError(f"unknown filter design {ftype}")
+
+    # write to a temporary file first, so concurrent runs never read half a file
+
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmp = f"{fileName}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, sos)
+        os.replace(tmp, fileName)
+    except OSError:
+        pass
+
+    return sos
+
 
-__all__ = ['filt_p', 'ema', 'cheby2', 'elliptic', 'nofilt', 'getFilter']
+__all__ = ['filt_p', 'ema', 'cheby2', 'elliptic', 'bessel', 'cascade', 'minphase', 'nofilt',
+           'getFilter', 'groupDelay']
 
 # Create a custom property object to parse the filter spec.
 
@@ -74,6 +192,12 @@ class Filter(propObj):
                 name = 'E'
             elif 'nofilt'.startswith(name):
                 name = 'n'
+            elif 'bessel'.startswith(name):
+                name = 'b'
+            elif 'cascade'.startswith(name):
+                name = 'p'
+            elif 'minphase'.startswith(name):
+                name = 'm'
             else:
                 raise
             d = self.optDict(val[1:])
@@ -92,6 +216,12 @@ class Filter(propObj):
                 r = (name, cutoff, order, rp, dB)
             elif name == 'n':
                 r = (name,)
+            elif name == 'b':
+                r = (name, d.get('cutoff'), d.get('order', 4))
+            elif name == 'p':
+                r = (name, d.get('cutoff'), d.get('order', 2))
+            elif name == 'm':
+                r = (name, d.get('cutoff'), d.get('order', 63))
         except:
             raise ValueError(f"{self._name}: bad filter type specification")
 
@@ -109,6 +239,12 @@ class Filter(propObj):
             print(f"elliptic cutoff={t[1]} order={t[2]} rp={t[3]}, dB={t[4]}", file = file)
         elif name == 'n':
             print("nofilt", file = file)
+        elif name == 'b':
+            print(f"bessel cutoff={t[1]} order={t[2]}", file = file)
+        elif name == 'p':
+            print(f"cascade cutoff={t[1]} order={t[2]}", file = file)
+        elif name == 'm':
+            print(f"minphase cutoff={t[1]} order={t[2]}", file = file)
 
 
 # Options (command line or parameter file) used to specify the filter.
@@ -125,6 +261,14 @@ cheby2 VAR=VAL ...    Chebyshev type II, VAR may be order,
                       attenuation at the cutoff, deault 60.
 elliptic VAR=VAL ...  Elliptic. Defaults are as for cheby2,
                       rp (ripple) defaults to .1 dB.
+bessel VAR=VAL ...    Bessel, VAR may be order (default 4) or
+                      cutoff (-3 dB, in Hz).
+cascade VAR=VAL ...   order (default 2) identical one-pole
+                      sections, run as two-pole sections,
+                      -3 dB at cutoff (Hz).
+minphase VAR=VAL ...  Minimum-phase FIR with the magnitude response
+                      of a linear-phase firwin design of order taps
+                      (default 63), cutoff in Hz.
 nofilt                A filter that does nothing.
 The filter and var names may be either case and abbreviated.""")
 
@@ -147,8 +291,14 @@ class nofilt:
         """
 
         self.nChan = nChan
+        self.cutoff = None
         self.restart()
 
+    def sections(self):
+        "Return the filter as a list of (b, a) sections, see groupDelay()."
+
+        return [([1.], [1.])]
+
     def restart(self):
         """Restarting the filter does nothing."""
 
@@ -162,9 +312,20 @@ class nofilt:
 
         return data
 
+    def process_block(self, x):
+        """
+        Parameter: x, a (k, nChan) array of consecutive samples.
+        Returns: a copy of x, so the result stays valid when x is a
+        view of the ring buffer.
+        """
+
+        return np.array(x, dtype=float)
+
 
 class ema:
 
+    longBlock = 1000    # blocks longer than this are filtered by lfilter
+
     def __init__(self, nChan, tau, fs=1000):
         """Create a multi-channel exponential moving average filter.
 
@@ -187,7 +348,17 @@ class ema:
 
         self.nChan = nChan
         self.a = np.e**(-1 / (fs * tau)) # time decay
-        self.restart()
+        # -3 dB point, |1-a|**2 = |1 - a e^-jw|**2 / 2; for tau below 0.57/fs
+        # the response stays above -3 dB up to Nyquist
+
+        c = (4*self.a - 1 - self.a**2) / (2*self.a)
+        self.cutoff = fs / (2 * np.pi) * np.arccos(max(c, -1))
+        self.mav = np.zeros(self.nChan)
+
+    def sections(self):
+        "Return the filter as a list of (b, a) sections, see groupDelay()."
+
+        return [([1 - self.a], [1, -self.a])]
 
     def restart(self):
         """Restart the filter by setting the moving averages to zero."""
@@ -205,8 +376,104 @@ class ema:
 
         return self.mav
 
+    def process_block(self, x):
+        """
+        Parameter: x, a (k, nChan) array of consecutive samples.
+        Returns: a (k, nChan) array of moving averages. The state is
+        carried over, as if __call__ had been called for each row.
+        """
+
+        # y[n] = (1-a) x[n] + a y[n-1], with the same rounding as __call__.
+        # Live drains are short and run step by step in numpy, so live runs
+        # never import scipy; long blocks (offline reprocessing) go to
+        # lfilter, whose recursion rounds the same way
+
+        a = self.a
+        if len(x) > self.longBlock:
+            y, _ = loadSignal().lfilter([1-a], [1, -a], x, axis=0, zi=a * self.mav[np.newaxis])
+            self.mav = y[-1].copy()
+            return y
+
+        y = (1-a) * np.asarray(x, dtype=float)
+        mav = self.mav
+        for row in y:
+            row += a * mav
+            mav = row
+        self.mav = mav.copy()
+
+        return y
+
+
+class sosfilter:
+    """Base class of the filters implemented as a cascade of second-order
+    sections. A subclass designs the filter and calls setup() with the
+    (nSections, 6) sos array from scipy.signal.
+
+    The state of all channels is kept in self.d, shape (nSections, nChan, 2):
+    the transposed direct form II state of each section, updated for all
+    channels at once by the compiled kernel of scipy's sosfilt (or by
+    signal.sosfilt itself, if that kernel fails checkKernel()). Each step
+    is exactly what sosfilt computes over the same samples.
+    """
+
+    def setup(self, nChan, sos, cutoff):
+
+        self.cutoff = cutoff
+        self.sos = np.ascontiguousarray(sos, dtype=float)
+        self.nSections = len(self.sos)
+        self.nChan = nChan
+        self.N = 2 * self.nSections
+        self.zero()
+
+    def sections(self):
+        "Return the filter as a list of (b, a) sections, see groupDelay()."
+
+        return [(row[:3], row[3:]) for row in self.sos]
+
+    def zero(self):
 
-class cheby2:
+        # stored channel-major, the layout the kernel works on in place
+
+        self.zi = np.zeros((self.nChan, self.nSections, 2))
+        self.d = self.zi.transpose(1, 0, 2)
+
+    def restart(self):
+        """Restart the filter by setting the state vectors to zero."""
+
+        self.zero()
+        loadSignal()
+
+    def __call__(self, arr):
+        """
+        Parameter: arr, an array of length nChan.
+        Returns: a filtered array of the same length.
+        """
+
+        return self.process_block(np.reshape(arr, (1, self.nChan)))[0]
+
+    def process_block(self, x):
+        """
+        Parameter: x, a (k, nChan) array of consecutive samples.
+        Returns: a filtered (k, nChan) array. The state vectors are
+        carried over, as if __call__ had been called for each row.
+        """
+
+        signal = loadSignal()
+        if _sosfilt is None:
+            y, zf = signal.sosfilt(self.sos, x, axis=0, zi=self.d.transpose(0, 2, 1))
+            self.d[:] = zf.transpose(0, 2, 1)
+            return y
+
+        # the kernel filters (nChan, k) rows in place, skipping the
+        # argument checks and axis shuffling that dominate for short blocks
+
+        y = np.array(x, dtype=float, order='F')
+        _sosfilt(self.sos, y.T, self.zi)
+
+        return y
+
+
+class cheby2(sosfilter):
 
     def __init__(self, nChan, cutoff, N=10, dB=60, fs=1000, btype='lowpass'):
         """Create a multi-channel Chebyshev type II lowpass filter.
@@ -246,50 +513,14 @@ class cheby2:
                 # y is now an array with the same length (3) as data
         """
 
-        # First, get the numerator (b) and denominator (a) coefficients
-        # of the filter.
+        # Design the filter as second-order sections, which stay
+        # accurate at high order where the b/a polynomials do not.
 
-        b, a = signal.cheby2(N, dB, cutoff, fs=fs, btype=btype)
-        self.a = a
-        self.b = b
+        sos = designFilter('cheby2', N, cutoff, dB, fs=fs, btype=btype)
+        self.setup(nChan, sos, cutoff)
 
-        # Initialize nChan state vectors.
 
-        self.nChan = nChan
-        self.N = N
-        self.restart()
-
-    def restart(self):
-        """Restart the filter by setting the state vectors to zero."""
-
-        self.d = np.zeros((self.nChan, self.N))
-
-    def __call__(self, arr):
-        """
-        Parameter: arr, an array of length nChan.
-        Returns: a filtered array of the same length.
-        """
-
-        n = self.nChan
-        N = self.N
-        a = self.a
-        b = self.b
-        r = np.empty(n)
-
-        # Compute the output and update the state vectors.
-
-        for j in range(n):
-            x = arr[j]
-            d = self.d[j]
-            y = b[0] * x + d[0]
-            for i in range(N-1):
-                d[i] = b[i+1] * x - a[i+1] * y + d[i+1]
-            d[N-1] = b[N] * x - a[N] * y
-            r[j] = y
-
-        return r
-
-class elliptic:
+class elliptic(sosfilter):
 
     def __init__(self, nChan, cutoff, N=10, rp=.1, dB=60, fs=1000, btype='lowpass'):
         """Create a multi-channel Elliptic lowpass filter.
@@ -332,25 +563,139 @@ class elliptic:
                 # y is now an array with the same length (3) as data
         """
 
-        # First, get the numerator (b) and denominator (a) coefficients
-        # of the filter.
+        # Design the filter as second-order sections (see cheby2).
+
+        sos = designFilter('ellip', N, cutoff, dB, rp, fs=fs, btype=btype)
+        self.setup(nChan, sos, cutoff)
+
+
 
-        b, a = signal.ellip(N, rp, dB, cutoff, fs=fs, btype=btype)
-        self.a = a
-        self.b = b
+class bessel(sosfilter):
 
-        # Initialize nChan state vectors.
+    def __init__(self, nChan, cutoff, N=4, fs=1000, btype='lowpass'):
+        """Create a multi-channel Bessel lowpass filter. Its group delay
+        is nearly constant across the passband, and much shorter than that
+        of a cheby2 or elliptic filter with the same cutoff.
+
+        Parameters:
+
+            nChan : int
+                The number of channels. All channels start with a zero
+                state vector.
+
+            cutoff : float
+                Cutoff frequency (-3 dB), in Hz.
+
+            N : int
+                The order of the filter; defaults to 4.
+
+            fs : int
+                Sampling rate, in Hz. Defaults to 1000.
+
+            btype : str
+                Filter type. Only 'lowpass' is supported.
+
+        Returns:
+
+            The instance is a callable that implements the
+            filter one point at a time (see cheby2).
+        """
+
+        sos = designFilter('bessel', N, cutoff, fs=fs, btype=btype)
+        self.setup(nChan, sos, cutoff)
+
+
+class cascade(sosfilter):
+
+    def __init__(self, nChan, cutoff, N=2, fs=1000):
+        """Create a multi-channel cascade of N identical one-pole lowpass
+        sections (an ema applied N times), run as N//2 critically damped
+        two-pole sections plus one one-pole section if N is odd. It has
+        no overshoot and a short delay, and needs no filter design.
+
+        Parameters:
+
+            nChan : int
+                The number of channels. All channels start with a zero
+                state vector.
+
+            cutoff : float
+                Cutoff frequency (-3 dB) of the whole cascade, in Hz.
+
+            N : int
+                The number of one-pole sections; defaults to 2.
+
+            fs : int
+                Sampling rate, in Hz. Defaults to 1000.
+
+        Returns:
+
+            The instance is a callable that implements the
+            filter one point at a time (see cheby2).
+        """
+
+        # a is the pole of one section (as in ema), chosen so that each
+        # section passes g = 2**(-1/N) of the power at cutoff:
+        # (1-a)**2 = g (1 - 2a cos(w) + a**2)
+
+        g = 2**(-1 / N)
+        c = np.cos(2 * np.pi * cutoff / fs)
+        a = ((1 - g*c) - np.sqrt((1 - g*c)**2 - (1 - g)**2)) / (1 - g)
+
+        sos = [[(1-a)**2, 0, 0, 1, -2*a, a**2]] * (N // 2)
+        if N % 2:
+            sos.append([1-a, 0, 0, 1, -a, 0])
+        self.setup(nChan, sos, cutoff)
+
+
+class minphase:
+
+    def __init__(self, nChan, cutoff, N=63, fs=1000):
+        """Create a multi-channel minimum-phase FIR lowpass filter.
+
+        The filter has the magnitude response of an N tap linear-phase
+        lowpass (scipy.signal.firwin), with about half its delay at low
+        frequencies. An FIR filter has no feedback, so it cannot ring or
+        become unstable.
+
+        Parameters:
+
+            nChan : int
+                The number of channels. All channels start with a zero
+                state vector.
+
+            cutoff : float
+                Cutoff frequency of the linear-phase design, in Hz.
+
+            N : int
+                Number of taps, as in the linear-phase design; defaults
+                to 63.
+
+            fs : int
+                Sampling rate, in Hz. Defaults to 1000.
+
+        Returns:
+
+            The instance is a callable that implements the
+            filter one point at a time (see cheby2).
+        """
 
         self.nChan = nChan
-        self.N = N
-        self.restart()
+        self.cutoff = cutoff
+        self.h = designFilter('minphase', N, cutoff, fs=fs)
+        self.N = len(self.h) - 1
+        self.zi = np.zeros((self.N, self.nChan))
 
-    # These are the same as cheby2, so could subclass ...
+    def sections(self):
+        "Return the filter as a list of (b, a) sections, see groupDelay()."
+
+        return [(self.h, [1.])]
 
     def restart(self):
         """Restart the filter by setting the state vectors to zero."""
 
-        self.d = np.zeros((self.nChan, self.N))
+        self.zi = np.zeros((self.N, self.nChan))
+        loadSignal()
 
     def __call__(self, arr):
         """
@@ -358,25 +703,22 @@ class elliptic:
         Returns: a filtered array of the same length.
         """
 
-        n = self.nChan
-        N = self.N
-        a = self.a
-        b = self.b
-        r = np.empty(n)
+        return self.process_block(np.reshape(arr, (1, self.nChan)))[0]
 
-        # Compute the output and update the state vectors.
+    def process_block(self, x):
+        """
+        Parameter: x, a (k, nChan) array of consecutive samples.
+        Returns: a filtered (k, nChan) array. The state vectors are
+        carried over, as if __call__ had been called for each row.
+        """
 
-        for j in range(n):
-            x = arr[j]
-            d = self.d[j]
-            y = b[0] * x + d[0]
-            for i in range(N-1):
-                d[i] = b[i+1] * x - a[i+1] * y + d[i+1]
-            d[N-1] = b[N] * x - a[N] * y
-            r[j] = y
+        # a = [1, 0] keeps lfilter on its recursive kernel, which carries
+        # the state exactly (with a = [1] it convolves and rounds differently
+        # for every block length)
 
-        return r
+        y, self.zi = loadSignal().lfilter(self.h, [1., 0.], x, axis=0, zi=self.zi)
 
+        return y
 
 
 def getFilter(s_sens, filter):
@@ -400,8 +742,48 @@ def getFilter(s_sens, filter):
     elif filter[0] == 'n':
         filter_ref = nofilt(nRef)
     
+    elif filter[0] == 'b':
+        cutoffFreq, order = filter[1:]
+        filter_ref = bessel(nRef, cutoffFreq, N=order)
+
+    elif filter[0] == 'p':
+        cutoffFreq, order = filter[1:]
+        filter_ref = cascade(nRef, cutoffFreq, N=order)
+
+    elif filter[0] == 'm':
+        cutoffFreq, order = filter[1:]
+        filter_ref = minphase(nRef, cutoffFreq, N=order)
+
     else:
         print(f"Unknown filter type {filter}.")
         sys.exit(1)
     
-    return filter_ref
\ No newline at end of file
+    # measure the delay the filter adds to the compensation, at DC and at
+    # the cutoff; it is kept in filter_ref.delay ({Hz: samples})
+
+    freqs = [0] if filter_ref.cutoff is None else [0, filter_ref.cutoff]
+    filter_ref.delay = dict(zip(freqs, groupDelay(filter_ref, freqs).tolist()))
+    s_sens.info("filter group delay: " + ", ".join(f"{d:.2f} samples at {f:g} Hz" for f, d in filter_ref.delay.items()))
+
+    return filter_ref
+
+
+def groupDelay(filt, freqs, fs=1000):
+    """Return the group delay of filt, in samples, at each frequency in
+    freqs (Hz).
+
+    The delay of a cascade is the sum of the delays of its sections, as
+    returned by filt.sections(), and that of a section b/a is the delay
+    of b minus the delay of a, where a polynomial p delays by
+    Re(sum(m p[m] z^-m) / sum(p[m] z^-m)). Working one section at a time
+    stays accurate for high order filters whose b/a polynomials are badly
+    conditioned, and needs no scipy."""
+
+    w = 2 * np.pi * np.asarray(freqs, dtype=float) / fs
+
+    def delay(p):
+        m = np.arange(len(p))
+        z = np.exp(-1j * np.outer(w, m))
+        return np.real((z @ (m * np.asarray(p, dtype=float))) / (z @ np.asarray(p, dtype=float)))
+
+    return sum(delay(b) - delay(a) for b, a in filt.sections())
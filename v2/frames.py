@@ -0,0 +1,139 @@
+"""This module converts FieldLine data frames into numpy rows.
+
+    The FieldLine callback delivers one dict per sample, of the form
+
+        {'timestamp': ticks, 'data_frames': {chName: {'data': value, ...}, ...}}
+
+    A FrameDecoder is built once from the channel names and turns such a
+    dict into a single row laid out as
+
+        [timestamp, ref_0 ... ref_n, prim_0 ... prim_m, adc_0 ... adc_k]
+
+    with the magnetometers in nT and the ADCs in volts.
+
+    findGaps() checks a recorded timestamp column for continuity.
+"""
+
+import numpy as np
+from itertools import chain
+from operator import itemgetter
+from constants import *
+
+__all__ = ['FrameDecoder', 'findGaps']
+
+tickRate = 25e6 # the api timestamps count ticks of a 25 MHz clock
+
+
+class FrameDecoder:
+
+    def __init__(self, chNames_Ref, chNames_Prim, ADCnames, calib):
+        """Create a decoder for a fixed set of channels.
+
+        Parameters:
+
+            chNames_Ref, chNames_Prim, ADCnames : lists of str
+                API channel names ("CC:SS:50", "CC:00:0", ...) of the
+                reference, primary and ADC channels, in storage order.
+
+            calib : float
+                Calibration value of the magnetometers (see
+                SensorManager.prepareForDFC).
+
+        Returns:
+
+            The instance is a callable that decodes one frame at a time.
+            The slices sRef, sPrim and sADC select the channel groups
+            in a decoded row; column 0 holds the raw timestamp in 25 MHz
+            ticks.
+        """
+
+        self.names = list(chNames_Ref) + list(chNames_Prim) + list(ADCnames)
+        self.nRef = len(chNames_Ref)
+        self.nPrim = len(chNames_Prim)
+        self.nADC = len(ADCnames)
+        self.nChan = len(self.names)
+        self.nCols = self.nChan + 1
+
+        self.sRef = slice(1, 1 + self.nRef)
+        self.sPrim = slice(self.sRef.stop, self.sRef.stop + self.nPrim)
+        self.sADC = slice(self.sPrim.stop, self.nCols)
+
+        # one scale factor per column, applied with a single multiply
+
+        self.scale = np.empty(self.nCols)
+        self.scale[0] = 1
+        self.scale[self.sRef] = calib * g   # in nT
+        self.scale[self.sPrim] = calib * g
+        self.scale[self.sADC] = calib_ADC
+
+        # itemgetter does the per-channel lookups in C; with a single
+        # name it returns the item itself instead of a tuple
+
+        getFrames = itemgetter(*self.names)
+        if self.nChan == 1:
+            self._getFrames = lambda d: (getFrames(d),)
+        else:
+            self._getFrames = getFrames
+        self._getData = itemgetter('data')
+
+        self.row = np.empty(self.nCols)
+
+    def __call__(self, data, out=None):
+        """
+        Parameters:
+
+            data : dict
+                A frame, as passed to the read_data() callback.
+
+            out : array of length nCols, optional
+                Where to write the row. Defaults to self.row, which is
+                overwritten by the next call.
+
+        Returns: out.
+        """
+
+        if out is None:
+            out = self.row
+
+        values = chain((data['timestamp'],), map(self._getData, self._getFrames(data['data_frames'])))
+        np.multiply(np.fromiter(values, float, self.nCols), self.scale, out=out)
+
+        return out
+
+
+def findGaps(tTicks, fs):
+    """Find discontinuities in a recorded timestamp array.
+
+    Parameters:
+
+        tTicks : array
+            Raw timestamps of consecutive recorded samples, in 25 MHz ticks.
+
+        fs : int
+            Sampling rate, in Hz.
+
+    Returns:
+
+        gapMask : boolean array, same length as tTicks
+            True for the first sample recorded after a gap.
+
+        gapPos : array of int
+            Indices of those samples.
+
+        gapMissing : array of int
+            Number of samples missing before each of them.
+
+        Timestamps that repeat or go backwards are reported as gaps with
+        a negative number of missing samples.
+    """
+
+    tTicks = np.asarray(tTicks, dtype=float).ravel()
+    gapMask = np.zeros(len(tTicks), dtype=bool)
+    if len(tTicks) < 2:
+        return gapMask, np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    missing = np.rint(np.diff(tTicks) * (fs / tickRate)).astype(int) - 1
+    gapMask[1:] = missing != 0
+    gapPos = np.flatnonzero(gapMask)
+
+    return gapMask, gapPos, missing[gapPos - 1]
@@ -1,12 +1,41 @@
 import pickle
 from os.path import exists, split
 from constants import *
+from recorder import attachStream
 import logging
+import logging.handlers
+import queue
+import atexit
 
         
     
-def configure_logging(p, mode):
-
+class droppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that never blocks: if the queue is full the record is
+    dropped and counted in self.dropped.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(p, mode, queueLen=10000):
+    """Set up the DFClog logger.
+
+    Records go through a bounded queue to a QueueListener thread, which
+    does the file and console output, so a logger call from the
+    acquisition path only formats the message and enqueues it. When the
+    queue is full the record is dropped and counted (logger.handler.dropped).
+    Call stop_logging() at the end to flush the queue; it is also registered
+    to run at exit, so the records queued before a crash still reach the
+    file.
+    """
 
     fh = logging.FileHandler(f"{p.sPath}_exp.txt", mode)
     formatter = logging.Formatter("%(filename)s:%(lineno)d | %(message)s")
@@ -19,7 +48,6 @@ def configure_logging(p, mode):
     root = logging.getLogger(name='DFClog')
 
     root.setLevel(logging.DEBUG)
-    root.addHandler(fh)
     root.addFilter(f)
     
     console = logging.StreamHandler()
@@ -28,11 +56,28 @@ def configure_logging(p, mode):
     # set format for console output    
     console.setFormatter(logging.Formatter("%(message)s"))
 
-    # add the handler to the root logger
-    root.addHandler(console)
+    # the file and console handlers run on the listener thread
+
+    qh = droppingQueueHandler(queue.Queue(queueLen))
+    root.addHandler(qh)
+    root.handler = qh
+    root.listener = logging.handlers.QueueListener(qh.queue, fh, console,
+                                                   respect_handler_level=True)
+    root.listener.start()
     root.propagate = False
+    atexit.register(stop_logging, root)
     return root
 
+
+def stop_logging(logger):
+    "Flush the queued records and stop the listener thread."
+
+    atexit.unregister(stop_logging)
+    logger.listener.stop()
+    for h in logger.listener.handlers:
+        h.close()
+    logger.removeHandler(logger.handler)
+
    
 
 class testFilter(logging.Filter):
@@ -66,6 +111,11 @@ def loadPickle(file):
     for key in var.__dict__.keys():
         setattr(st, key, var.__dict__[key])
 
+    # map streamed raw data back in (see recorder.py)
+
+    if hasattr(st, 'streams'):
+        attachStream(st, split(file.name)[0])
+
 
     return st
 
@@ -0,0 +1,48 @@
+"""This module summarizes the per-stage latency stamps of the DFC loop.
+
+    For every compensation update the loop records one row of
+    perf_counter_ns stamps, relative to the start of the run:
+
+        arrival   the callback stored the newest sample of the block
+        drain     the main loop woke up to drain the ring buffer
+        filter    the reference filter returned
+        compute   the compensation fields were computed
+        payload   the adjust_fields payload was built
+        adjust    adjust_fields returned (equal to payload if skipped)
+"""
+
+import numpy as np
+
+__all__ = ['STAGES', 'stageStats', 'formatStageStats']
+
+STAGES = ['arrival', 'drain', 'filter', 'compute', 'payload', 'adjust']
+
+PCTS = [50, 90, 99]
+
+
+def stageStats(stamps):
+    """Return a dict {interval: (p50, p90, p99, max)} in ms, for each
+    consecutive pair of stages and for arrival->adjust, from an (n, 6)
+    array of stamps in ns."""
+
+    stamps = np.asarray(stamps)
+    if len(stamps) == 0:
+        return {}
+
+    names = [f"{a}->{b}" for a, b in zip(STAGES[:-1], STAGES[1:])] + [f"{STAGES[0]}->{STAGES[-1]}"]
+    d = np.diff(stamps, axis=1)
+    d = np.hstack((d, stamps[:, -1:] - stamps[:, :1])) * 1e-6
+
+    p = np.percentile(d, PCTS, axis=0)
+    m = d.max(axis=0)
+
+    return {n: tuple(p[:, i].tolist()) + (float(m[i]),) for i, n in enumerate(names)}
+
+
+def formatStageStats(stats):
+    "Return the stats as a printable table."
+
+    s = f"{'stage (ms)':<20s}" + ''.join(f"{'p' + str(q):>10s}" for q in PCTS) + f"{'max':>10s}\n"
+    for name, v in stats.items():
+        s += f"{name:<20s}" + ''.join(f"{x:10.3f}" for x in v) + "\n"
+    return s
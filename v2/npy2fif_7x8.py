@@ -5,6 +5,7 @@ from constants import *
 from mne.transforms import apply_trans
 import tensorly as tl
 from filters import *
+from frames import findGaps
 
 
 def computeSynthGrad(s_data,s_sens, s_geom):
@@ -16,18 +17,33 @@ def computeSynthGrad(s_data,s_sens, s_geom):
 
     return gradPrim
 
-def filterRefSens(s_data, filter_ref):
+def filterRefSens(s_data, filter_ref, chunk=60*fs):
 
-    ''' filter ref sensors offline'''
+    ''' filter ref sensors offline, chunk samples at a time; process_block
+    carries the filter state across chunks, so the result is the same as
+    filtering one sample at a time as the online loop does'''
 
     filter_ref.restart()
         
     filtDataRef = np.empty(s_data.rawDataRef.shape)
-    for n in range(s_data.rawDataRef.shape[0]):    
-        filtDataRef[n,:] = filter_ref(s_data.rawDataRef[n,:])
+    for n in range(0, s_data.rawDataRef.shape[0], chunk):    
+        filtDataRef[n:n+chunk,:] = filter_ref.process_block(s_data.rawDataRef[n:n+chunk,:])
 
     return filtDataRef
 
+def findDataGaps(s_data):
+
+    ''' get gap positions and missing sample counts from the recorded timestamps'''
+
+    if hasattr(s_data, 'tTicks'):
+        tTicks = s_data.tTicks
+    else:
+        tTicks = s_data.tArray * 25 # older recordings: time in us from the first sample
+
+    _, gapPos, gapMissing = findGaps(tTicks, fs)
+
+    return gapPos, gapMissing
+
 def renameMEGChanAndGetInd(s_sens):
 
     ''' 
@@ -214,6 +230,14 @@ def npy2fif(s_data, s_sens, s_geom, filter_ref, sPath):
 
     s_sens.logger.info('saving raw mne object...') 
     raw = mne.io.RawArray(data,info)
+
+    # mark gaps in the timestamps, one sample long at the first sample after each gap
+
+    gapPos, gapMissing = findDataGaps(s_data)
+    if len(gapPos) > 0:
+        s_sens.info(f"{int(gapMissing[gapMissing > 0].sum())} missing samples in {len(gapPos)} gaps")
+        raw.set_annotations(mne.Annotations(onset=gapPos/fs, duration=np.full(len(gapPos), 1/fs),
+                                            description=['BAD_gap']*len(gapPos)))
     raw.save(sPath + '_raw.fif', overwrite=True)
 
     s_sens.info('done.') 
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""This module connects the stages of the DFC loop.
+
+    acquisition   the read_data() callback decodes frames into a ring
+                  buffer (see ringbuffer.py)
+    DFC           the main loop drains that buffer, filters the refs,
+                  computes and sends the compensation
+    persistence   a PersistStage thread moves recorded rows into the
+                  chunk recorders (see recorder.py)
+
+    The DFC stage hands rows to the persistence stage through Taps,
+    bounded single-producer single-consumer buffers that never block: if
+    one is full, the rows are dropped and counted. Every stage keeps a
+    StageStats with its service time and backlog.
+"""
+
+import os
+import time
+import threading
+import numpy as np
+from ringbuffer import RingBuffer
+
+__all__ = ['StageStats', 'Tap', 'PersistStage']
+
+
+class StageStats:
+
+    def __init__(self, name):
+        """Service time and backlog of one stage. Only the stage's own
+        thread calls record()."""
+
+        self.name = name
+        self.n = 0
+        self.busy = 0           # total service time, ns
+        self.busyMax = 0
+        self.backlog = 0        # items waiting at the last record()
+        self.backlogMax = 0
+
+    def record(self, dt, backlog):
+        """Record one service of dt ns that found backlog items waiting."""
+
+        self.n += 1
+        self.busy += dt
+        if dt > self.busyMax:
+            self.busyMax = dt
+        self.backlog = backlog
+        if backlog > self.backlogMax:
+            self.backlogMax = backlog
+
+    def summary(self):
+        "Return a one-line summary, times in ms."
+
+        mean = self.busy / max(self.n, 1) * 1e-6
+        return f"{self.name}: {self.n} services, mean {mean:.3f} ms, max {self.busyMax * 1e-6:.3f} ms, " \
+               f"max backlog {self.backlogMax}"
+
+
+class Tap:
+
+    def __init__(self, rec, capacity):
+        """A bounded handoff to rec, a ChunkRecorder owned by the
+        persistence stage.
+
+        Parameters:
+
+            rec : ChunkRecorder
+                Where the rows end up.
+
+            capacity : int
+                Number of rows the tap can hold.
+        """
+
+        self.rec = rec
+        self.ring = RingBuffer(capacity, rec.nCols)
+        self.stats = StageStats(os.path.basename(rec.fileName))
+
+    def append(self, block):
+        """Producer side: queue a row or a (k, nCols) block. Never blocks."""
+
+        self.ring.writeBlock(np.reshape(block, (-1, self.rec.nCols)))
+
+    def drain(self):
+        """Consumer side: move all pending rows to the recorder. Returns
+        the number of rows moved."""
+
+        k = self.ring.available()
+        if k > 0:
+            t0 = time.perf_counter_ns()
+            self.rec.append(self.ring.pending(k))
+            self.ring.release(k)
+            self.stats.record(time.perf_counter_ns() - t0, k)
+
+        return k
+
+    @property
+    def overflow(self):
+        return self.ring.overflow
+
+
+class PersistStage(threading.Thread):
+
+    def __init__(self, taps, period=.01):
+        """The persistence stage.
+
+        Parameters:
+
+            taps : list of Tap
+                Drained every period seconds.
+
+            period : float
+                Polling period, in seconds.
+        """
+
+        super().__init__(daemon=True)
+        self.taps = taps
+        self.period = period
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.period):
+            for tap in self.taps:
+                tap.drain()
+
+        # final drain, the producers have stopped
+
+        for tap in self.taps:
+            tap.drain()
+
+    def stop(self):
+        "Drain everything that is pending and stop the thread."
+
+        self._done.set()
+        self.join()
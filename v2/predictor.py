@@ -0,0 +1,218 @@
+"""This module forecasts the filtered reference field at the time a
+compensation update will actually be applied.
+
+    The fields sent by adjust_fields() are computed from the newest
+    filtered reference sample, but they reach the coils some time later
+    (the loop latency), and the reference filter adds its own group delay
+    on top. A RefPredictor extrapolates the filtered references over that
+    horizon, for all references at once, with either
+
+        linear   a least-squares line through the last nHist samples
+        ar       an AR model of the sample-to-sample differences, fitted
+                 online with block normalized LMS (one weight update per
+                 drained block), and run over the horizon in one step
+                 with the power of its companion matrix
+
+    The loop latency is measured: observeLatency() takes the arrival to
+    adjust_fields() return time of every update. Every forecast is checked
+    when its target sample arrives, and the residuals are compared with
+    those of simply holding the newest sample.
+"""
+
+import numpy as np
+from collections import deque
+
+__all__ = ['RefPredictor']
+
+
+class RefPredictor:
+
+    def __init__(self, nChan, method='linear', nHist=8, order=4, mu=.5, lead=0, fs=1000):
+        """
+        Parameters:
+
+            nChan : int
+                Number of reference channels.
+
+            method : str
+                'linear' or 'ar'.
+
+            nHist : int
+                Number of samples the linear fit uses.
+
+            order : int
+                Order of the AR model.
+
+            mu : float
+                NLMS step size of the AR model, 0 < mu < 2.
+
+            lead : float
+                Constant added to the measured latency, in samples;
+                normally the group delay of the reference filter.
+
+            fs : int
+                Sampling rate, in Hz.
+        """
+
+        if method not in ('linear', 'ar'):
+            raise ValueError(f"unknown predictor {method}")
+
+        self.nChan = nChan
+        self.method = method
+        self.nHist = nHist
+        self.lead = lead
+        self.fs = fs
+        self.mu = mu
+
+        # least-squares slope weights over the history, newest sample at t = 0
+
+        t = np.arange(nHist) - (nHist - 1.)
+        self.tMean = t.mean()
+        self.wSlope = (t - self.tMean) / ((t - self.tMean)**2).sum()
+
+        self.hist = np.zeros((nHist, nChan))
+        self.n = 0
+
+        self.order = order
+        self.w = np.zeros((nChan, order))       # AR weights
+        self.phi = np.zeros((nChan, order))     # recent differences, newest first
+
+        # companion matrices of the AR model, with a last row and column
+        # that accumulate the forecast differences
+
+        self.M = np.zeros((nChan, order + 1, order + 1))
+        self.M[:, 1:order, :order-1] = np.eye(order - 1)
+        self.M[:, order, order] = 1
+        self._idx = {}                          # regressor indices per block length
+
+        self.latency = 0.                       # in samples
+        self.alpha = .05                        # latency smoothing
+
+        self.pending = deque()                  # (target sample, forecast, held value)
+        self.nErr = 0
+        self.sse = np.zeros(nChan)
+        self.sseHold = np.zeros(nChan)
+        self.maxErr = np.zeros(nChan)
+
+    def update(self, filt, sampleCount):
+        """Add a block of filtered reference samples.
+
+        Parameters:
+
+            filt : array, shape (k, nChan)
+                Filtered references.
+
+            sampleCount : int
+                Index of the last sample of the block.
+        """
+
+        k = len(filt)
+        s0 = sampleCount - k + 1
+
+        # score the forecasts whose target is in this block
+
+        while self.pending and self.pending[0][0] <= sampleCount:
+            target, pred, hold = self.pending.popleft()
+            if target >= s0:
+                y = filt[target - s0]
+                e = y - pred
+                self.sse += e * e
+                self.sseHold += (y - hold)**2
+                np.maximum(self.maxErr, np.abs(e), out=self.maxErr)
+                self.nErr += 1
+
+        if self.method == 'ar':
+            self.fit(filt)
+        self.n += k
+
+        if k >= self.nHist:
+            self.hist[:] = filt[-self.nHist:]
+        else:
+            self.hist[:-k] = self.hist[k:]
+            self.hist[-k:] = filt
+
+    def fit(self, filt):
+        """One block NLMS step of the AR weights over the differences of
+        filt: the errors of all samples are taken with the weights at the
+        start of the block, and the weights are updated once. For a block
+        of one sample this is the plain NLMS step."""
+
+        p = self.order
+        prev = self.hist[-1]
+        if self.n == 0:
+            prev, filt = filt[0], filt[1:]
+        k = len(filt)
+        if k == 0:
+            return
+
+        # seq: the last p differences, oldest first, then those of the block;
+        # the regressors are the p differences before each sample, newest first
+
+        seq = np.empty((self.nChan, p + k))
+        seq[:, :p] = self.phi[:, ::-1]
+        seq[:, p] = filt[0] - prev
+        seq[:, p+1:] = (filt[1:] - filt[:-1]).T
+
+        if k not in self._idx:
+            self._idx[k] = np.arange(k)[:, np.newaxis] + np.arange(p - 1, -1, -1)
+        Phi = seq[:, self._idx[k]]
+
+        e = seq[:, p:] - (Phi @ self.w[:, :, np.newaxis])[:, :, 0]
+        g = (e[:, np.newaxis, :] @ Phi)[:, 0]
+        self.w += self.mu * g / (1e-12 + (Phi * Phi).sum(axis=(1, 2)))[:, np.newaxis]
+        self.phi[:] = seq[:, :-p-1:-1]
+
+    def observeLatency(self, ns):
+        """Update the latency estimate with one arrival to adjust_fields()
+        return time, in ns."""
+
+        self.latency += self.alpha * (ns * self.fs * 1e-9 - self.latency)
+
+    def horizon(self):
+        """Return the forecast horizon, in samples."""
+
+        return self.latency + self.lead
+
+    def predict(self, sampleCount):
+        """Return the forecast of the filtered references horizon()
+        samples after sampleCount, the index of the newest sample."""
+
+        h = self.horizon()
+        hold = self.hist[-1].copy()
+
+        if self.n < self.nHist:
+            pred = hold
+        elif self.method == 'linear':
+            slope = self.wSlope @ self.hist
+            pred = self.hist.mean(axis=0) + slope * (h - self.tMean)
+        else:
+            # [phi, 0] times M**h gives the next h differences and their sum
+
+            self.M[:, 0, :self.order] = self.w
+            self.M[:, self.order, :self.order] = self.w
+            z = np.linalg.matrix_power(self.M, int(round(h))) @ np.append(self.phi, np.zeros((self.nChan, 1)), axis=1)[:, :, np.newaxis]
+            pred = hold + z[:, self.order, 0]
+
+            # an AR model with a root outside the unit circle makes the
+            # forecast grow without bound; never move further than the
+            # steepest recent slope would over the horizon
+
+            bound = h * np.abs(np.diff(self.hist, axis=0)).max(axis=0)
+            np.clip(pred, hold - bound, hold + bound, out=pred)
+
+        self.pending.append((sampleCount + int(round(h)), pred, hold))
+
+        return pred
+
+    def stats(self):
+        """Return a dict of residual statistics, per reference channel:
+        rms error of the forecasts and of holding the newest sample, and
+        the maximum absolute forecast error, in the units of the data."""
+
+        n = max(self.nErr, 1)
+
+        return {'n': self.nErr,
+                'rms': np.sqrt(self.sse / n),
+                'rmsHold': np.sqrt(self.sseHold / n),
+                'max': self.maxErr.copy(),
+                'horizon': self.horizon()}
@@ -0,0 +1,139 @@
+"""This module streams recorded samples to disk in fixed-size chunks,
+so that a recording of any length uses a constant amount of memory.
+
+    A ChunkRecorder copies rows into a chunk buffer; full chunks are
+    handed to a background writer thread, which appends them to a flat
+    binary file of float64 rows. The file can be read back lazily with
+    openStream(), which returns a read-only numpy memmap.
+
+    A recording is described in the saved data struct by a dict,
+
+        s_data.streams = {fileName: {'nCols': ..., 'nRows': ...,
+                                     'fields': {name: (start, stop), ...}}}
+
+    and attachStream() turns every field into an attribute of s_data
+    that is a (nRows, stop-start) view of the file.
+"""
+
+import os
+import queue
+import threading
+import numpy as np
+
+__all__ = ['ChunkRecorder', 'openStream', 'attachStream']
+
+
+class ChunkRecorder:
+
+    def __init__(self, fileName, nCols, chunkLen=1000, nChunks=4):
+        """Create a recorder and start its writer thread.
+
+        Parameters:
+
+            fileName : str
+                The file to write. It is truncated.
+
+            nCols : int
+                Length of each row.
+
+            chunkLen : int
+                Number of rows per chunk.
+
+            nChunks : int
+                Number of preallocated chunk buffers. If the writer falls
+                behind and all of them are in use, a new buffer is
+                allocated and counted in poolMisses.
+        """
+
+        self.fileName = fileName
+        self.nCols = nCols
+        self.chunkLen = chunkLen
+
+        self.nRows = 0          # rows appended
+        self.chunksWritten = 0
+        self.poolMisses = 0
+
+        self._free = queue.SimpleQueue()
+        for i in range(nChunks - 1):
+            self._free.put(np.empty((chunkLen, nCols)))
+        self._chunk = np.empty((chunkLen, nCols))
+        self._fill = 0
+
+        self._full = queue.SimpleQueue()
+        self._file = open(fileName, 'wb')
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def append(self, block):
+        """Copy a (k, nCols) block of rows into the recording."""
+
+        k = len(block)
+        i = 0
+        while i < k:
+            n = min(k - i, self.chunkLen - self._fill)
+            self._chunk[self._fill:self._fill + n] = block[i:i + n]
+            self._fill += n
+            i += n
+            if self._fill == self.chunkLen:
+                self._handOff()
+
+        self.nRows += k
+
+    def close(self):
+        """Write any partial chunk, stop the writer and close the file."""
+
+        if self._fill > 0:
+            self._handOff()
+        self._full.put(None)
+        self._writer.join()
+        self._file.close()
+
+    def _handOff(self):
+        self._full.put((self._chunk, self._fill))
+        try:
+            self._chunk = self._free.get_nowait()
+        except queue.Empty:
+            self._chunk = np.empty((self.chunkLen, self.nCols))
+            self.poolMisses += 1
+        self._fill = 0
+
+    def _write(self):
+        while True:
+            item = self._full.get()
+            if item is None:
+                break
+            chunk, n = item
+            chunk[:n].tofile(self._file)
+            self.chunksWritten += 1
+            self._free.put(chunk)
+
+
+def openStream(fileName, nCols, nRows=None):
+    """Return a read-only (nRows, nCols) memmap of a recorded file. If
+    nRows is None, all complete rows in the file are used."""
+
+    rowBytes = nCols * np.dtype(float).itemsize
+    nAvail = os.path.getsize(fileName) // rowBytes
+    if nRows is None or nRows > nAvail:
+        nRows = nAvail
+    if nRows == 0:
+        return np.empty((0, nCols))
+
+    return np.memmap(fileName, dtype=float, mode='r', shape=(nRows, nCols))
+
+
+def attachStream(s_data, dirName):
+    """Set lazy views of every field of every stream in s_data.streams
+    as attributes of s_data. Stream file names are relative to dirName.
+    If a tTicks field (25 MHz timestamps) is present, tArray is derived
+    from it as in the DFC loop."""
+
+    for fileName, d in s_data.streams.items():
+        mm = openStream(os.path.join(dirName, fileName), d['nCols'], d['nRows'])
+        for name, (start, stop) in d['fields'].items():
+            setattr(s_data, name, mm[:, start:stop])
+
+    if hasattr(s_data, 'tTicks') and len(s_data.tTicks) > 0:
+        s_data.tArray = (s_data.tTicks - s_data.tTicks[0]) / 25
+
+    return s_data
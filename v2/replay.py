@@ -0,0 +1,219 @@
+"""Replay a recorded session in place of the FieldLine service.
+
+    A ReplayService loads the _data.pkl/_sens.pkl pair of a recording and
+    answers every FLService call that DFC_7x8.main makes. read_data()
+    starts a timer thread that delivers the recorded samples to the
+    callback as FieldLine frames, so the whole acquisition and DFC code
+    path runs offline, without the hardware or the fieldline package.
+
+    The samples are paced either by their timestamps (the sample clock)
+    or by the times they originally arrived at the callback, which also
+    reproduces the bursts and stalls of the original run. speed scales
+    the replay: 1 is real time, 4 is four times faster, 0 delivers the
+    samples as fast as the callback takes them.
+
+    Usage, from DFC_7x8.py:
+        DFC_7x8.py --param example_param.param --replay data/20260101/primDFC_test
+"""
+
+import time
+import pickle
+import threading
+import numpy as np
+from io_dfc import loadPickle
+from frames import FrameDecoder, tickRate
+
+__all__ = ['ReplayService']
+
+
+class hardwareState:
+    "Stands in for service.hardware_state."
+
+    def __init__(self, ch_dict):
+        self.ch_dict = ch_dict
+
+    def get_channel_dict(self):
+        return self.ch_dict
+
+
+class ReplayService:
+
+    chunk = 1000    # samples converted back to raw values at a time
+
+    def __init__(self, sPath, speed=1, clock='arrival', adjustDelay=0):
+        """
+        Parameters:
+
+            sPath : str
+                Recording to replay, without the _data.pkl/_sens.pkl suffix.
+
+            speed : float
+                Replay speed relative to real time; 0 is as fast as possible.
+
+            clock : str
+                'arrival' paces the samples by their recorded arrival times,
+                'ticks' by their timestamps. Recordings made before the
+                arrival times were stored always use 'ticks'.
+
+            adjustDelay : float
+                Seconds each adjust_fields() call blocks, to stand in for
+                the cost of the real call. Default 0.
+        """
+
+        print(f"\nReplaying {sPath}")
+
+        s_data = loadPickle(sPath + "_data.pkl")
+        with open(sPath + "_sens.pkl", 'rb') as f:
+            s_sens = pickle.load(f)
+
+        self.load(s_data, s_sens, speed, clock, adjustDelay)
+
+    def load(self, s_data, s_sens, speed=1, clock='arrival', adjustDelay=0):
+        "Prepare the replay of the samples in s_data, recorded with s_sens."
+
+        self.s_sens = s_sens
+        self.speed = speed
+        self.adjustDelay = adjustDelay
+        self.sdict = s_sens.sdict
+
+        # channel names and raw values, undoing the calibration
+
+        decoder = FrameDecoder(s_sens.chNames_Ref, s_sens.chNames_Prim, s_sens.ADCnames, s_sens.calib)
+        self.names = decoder.names
+
+        if hasattr(s_data, 'tTicks'):
+            tTicks = np.asarray(s_data.tTicks).ravel()
+        else:
+            tTicks = np.asarray(s_data.tArray).ravel() * 25 # older recordings
+
+        # the samples stay where they are (memmap views of the stream file
+        # for a recording, see attachStream) and are converted back to raw
+        # values a chunk at a time while they are delivered
+
+        self.values = (s_data.rawDataRef, s_data.rawDataPrim, s_data.rawDataADC)
+        self.scale = decoder.scale[1:]
+        self.ticks = tTicks.astype(np.int64)
+        self.nFrames = len(self.ticks)
+
+        # replay schedule, in seconds from the first sample
+
+        if clock == 'arrival' and hasattr(s_data, 'tArrival'):
+            tArrival = np.asarray(s_data.tArrival).ravel()
+            self.tReplay = (tArrival - tArrival[0]) * 1e-9
+        else:
+            self.tReplay = (tTicks - tTicks[0]) / tickRate
+        self.clock = clock if hasattr(s_data, 'tArrival') else 'ticks'
+
+        # channel dict: the sensors' index is their position in sensID
+
+        suffix = s_sens.chNames_Ref[0][5:] if s_sens.chNames_Ref else ':50'
+        ch_dict = {f"{c:02d}:{s:02d}{suffix}": {'calibration': s_sens.calib, 'idx': i}
+                   for i, (c, s) in enumerate(s_sens.sensID)}
+        self.hardware_state = hardwareState(ch_dict)
+
+        # fine zero coefficients, as returned by getCoeffs()
+
+        fz = getattr(s_data, 'FZ_coeffs', None)
+        cs = [(c, s) for c in self.sdict for s in self.sdict[c]]
+        self.fields = dict(zip(cs, fz)) if fz is not None else {}
+
+        self.nAdjust = 0
+        self.nDelivered = 0
+        self.elapsed = 0
+        self.finished = False
+        self._thread = None
+        self._done = threading.Event()
+
+    def close(self):
+        self.read_data()
+
+    # sensor management: nothing to do with recorded data
+
+    def load_sensors(self):
+        return self.sdict
+
+    def getSensors(self):
+        "Get the list of all known (chassis, sensor) pairs."
+
+        sensors = list(self.s_sens.sensID)
+        print(f"\nFound sensors: {sensors}")
+
+        return sensors
+
+    def get_not_ready(self):
+        return []
+
+    def restartSensors(self, sdict, closedLoop=True):
+        print("\nDoing sensor restart (replay, skipped)")
+
+    def coarseZero(self, sdict):
+        print("\nDoing coarse zero (replay, skipped)")
+
+    def fineZero(self, sdict):
+        print("\nDoing fine zero (replay, skipped)")
+
+    def get_fields(self, c, s):
+        return self.fields.get((c, s))
+
+    def getCoeffs(self, sdict):
+        "get the recorded fine zero field offset values"
+
+        return [self.get_fields(c, s) for c in sdict for s in sdict[c]]
+
+    def start_adc(self, c):
+        pass
+
+    def stop_adc(self, c):
+        pass
+
+    def adjust_fields(self, sensor_dict):
+        self.nAdjust += 1
+        if self.adjustDelay:
+            time.sleep(self.adjustDelay)
+
+    # streaming
+
+    def read_data(self, callback=None):
+        """Start delivering the recorded samples to callback from a
+        timer thread, or stop the delivery if callback is None."""
+
+        if callback is None:
+            if self._thread is not None:
+                self._done.set()
+                self._thread.join()
+                self._thread = None
+            return
+
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def rawChunk(self, i0, i1):
+        "Return the raw integer values of samples i0 .. i1-1, as lists."
+
+        values = np.hstack([v[i0:i1] for v in self.values])
+
+        return np.rint(values / self.scale).astype(np.int64).tolist()
+
+    def _run(self, callback):
+
+        names = self.names
+        t0 = time.perf_counter()
+
+        for i0 in range(0, self.nFrames, self.chunk):
+            i1 = min(i0 + self.chunk, self.nFrames)
+            for i, raw in zip(range(i0, i1), self.rawChunk(i0, i1)):
+                if self._done.is_set():
+                    return
+
+                if self.speed > 0:
+                    dt = t0 + self.tReplay[i] / self.speed - time.perf_counter()
+                    if dt > 0:
+                        time.sleep(dt)
+
+                frames = {n: {'data': v} for n, v in zip(names, raw)}
+                callback({'timestamp': int(self.ticks[i]), 'data_frames': frames})
+                self.nDelivered += 1
+                self.elapsed = time.perf_counter() - t0
+
+        self.finished = True
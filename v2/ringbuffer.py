@@ -0,0 +1,140 @@
+"""This module implements a single-producer single-consumer ring buffer
+of numpy rows, used to hand samples from the FieldLine callback thread
+to the DFC loop.
+
+    The producer only ever writes self.written and the consumer only ever
+    writes self.read; both counters increase monotonically and are never
+    wrapped, so no lock is needed to share them.
+
+    The storage is mirrored (every row is written twice, capacity rows
+    apart), so that any run of up to capacity pending rows is contiguous
+    and can be returned as a view without copying.
+"""
+
+import threading
+import numpy as np
+
+__all__ = ['RingBuffer']
+
+
+class RingBuffer:
+
+    def __init__(self, capacity, nCols, dtype=float):
+        """Create a ring buffer.
+
+        Parameters:
+
+            capacity : int
+                Maximum number of pending rows. Rows that arrive while
+                the buffer is full are dropped and counted in overflow.
+
+            nCols : int
+                Length of each row.
+
+            dtype : numpy dtype
+                Defaults to float.
+        """
+
+        self.capacity = capacity
+        self.nCols = nCols
+        self.buf = np.empty((2 * capacity, nCols), dtype)
+
+        self.written = 0    # rows committed by the producer
+        self.read = 0       # rows released by the consumer
+        self.overflow = 0   # rows dropped because the buffer was full
+
+        self._event = threading.Event()
+
+    # Producer side.
+
+    def reserve(self):
+        """Return the next free row, to be filled in place and then
+        published with commit(). Returns None (and counts an overflow)
+        if the buffer is full."""
+
+        if self.written - self.read >= self.capacity:
+            self.overflow += 1
+            return None
+
+        return self.buf[self.written % self.capacity]
+
+    def commit(self):
+        """Publish the row returned by the last reserve()."""
+
+        i = self.written % self.capacity
+        self.buf[i + self.capacity] = self.buf[i]
+        self.written += 1
+        self._event.set()
+
+    def write(self, row):
+        """Copy row into the buffer. Returns False if it was dropped."""
+
+        slot = self.reserve()
+        if slot is None:
+            return False
+        slot[:] = row
+        self.commit()
+
+        return True
+
+    def writeBlock(self, block):
+        """Copy a (k, nCols) block into the buffer. Rows that do not fit
+        are dropped and counted in overflow. Returns the number of rows
+        written."""
+
+        cap = self.capacity
+        k = min(len(block), cap - (self.written - self.read))
+        self.overflow += len(block) - k
+
+        i = self.written % cap
+        n = min(k, cap - i)
+        self.buf[i:i + n] = block[:n]
+        self.buf[i + cap:i + cap + n] = block[:n]
+        self.buf[:k - n] = block[n:k]
+        self.buf[cap:cap + k - n] = block[n:k]
+
+        self.written += k
+        self._event.set()
+
+        return k
+
+    # Consumer side.
+
+    def available(self):
+        """Return the number of pending rows."""
+
+        return self.written - self.read
+
+    def wait(self, timeout=None):
+        """Block until at least one row is pending, or timeout seconds
+        have elapsed. Returns the number of pending rows.
+
+        The event is cleared before the counters are checked, so a row
+        committed at any point during the call always ends the wait."""
+
+        self._event.clear()
+        if self.written == self.read:
+            self._event.wait(timeout)
+
+        return self.written - self.read
+
+    def pending(self, k=None):
+        """Return a (k, nCols) view of the k oldest pending rows, or of
+        all pending rows if k is None. The rows stay valid until they are
+        released.
+
+        Rows may be committed between wait()/available() and this call;
+        pass the count those returned, so that exactly the rows that are
+        later released are consumed."""
+
+        r = self.read
+        i = r % self.capacity
+        if k is None:
+            k = self.written - r
+
+        return self.buf[i:i + k]
+
+    def release(self, k):
+        """Mark the k oldest pending rows as consumed."""
+
+        self.read += k
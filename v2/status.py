@@ -0,0 +1,99 @@
+"""This module reports the state of a running acquisition on the console.
+
+    The DFC loop never prints. Instead it updates a LoopCounters object,
+    whose fields are plain attributes written by a single thread, and a
+    StatusReporter thread reads them at a fixed rate and prints one line
+    with the samples received, the ring buffer backlog, the drop rate,
+    the compensation update rate and the recent p99 loop latency.
+"""
+
+import threading
+import time
+import numpy as np
+
+__all__ = ['LoopCounters', 'StatusReporter']
+
+
+class LoopCounters:
+
+    def __init__(self, nLatency=1024):
+        """Counters shared by the DFC loop (writer) and the reporter.
+
+        Parameters:
+
+            nLatency : int
+                Number of recent arrival to adjust_fields() latencies
+                kept for the p99.
+        """
+
+        self.samples = 0        # samples drained
+        self.updates = 0        # compensation updates
+        self.firstTick = None   # timestamps of the first and newest sample
+        self.lastTick = None
+
+        self.latency = np.full(nLatency, np.nan)   # ns
+        self.nLatency = 0
+
+    def addLatency(self, ns):
+        "Record the latency of one update."
+
+        self.latency[self.nLatency % len(self.latency)] = ns
+        self.nLatency += 1
+
+
+class StatusReporter(threading.Thread):
+
+    def __init__(self, counters, ring, rate=2, tickRate=25e6, fs=1000):
+        """
+        Parameters:
+
+            counters : LoopCounters
+                Updated by the DFC loop.
+
+            ring : RingBuffer
+                The acquisition ring buffer, for the backlog.
+
+            rate : float
+                Lines per second.
+
+            tickRate, fs : float
+                Timestamp clock and sampling rate, in Hz, used to count
+                the samples that never arrived.
+        """
+
+        super().__init__(daemon=True)
+        self.counters = counters
+        self.ring = ring
+        self.period = 1 / rate
+        self.samplesPerTick = fs / tickRate
+        self._done = threading.Event()
+
+    def line(self, dt, updates0):
+        c = self.counters
+        n = c.samples
+        if c.firstTick is None:
+            return "waiting for data"
+
+        expected = round((c.lastTick - c.firstTick) * self.samplesPerTick) + 1
+        # ring overflows never reach the loop, so their timestamps are
+        # already missing from the count
+
+        dropped = max(expected - n, 0)
+        p99 = np.nanpercentile(c.latency, 99) * 1e-6 if c.nLatency else np.nan
+
+        return f"samples {n}  backlog {self.ring.available()}  " \
+               f"drop {100 * dropped / max(expected, 1):.2f}%  " \
+               f"updates {(c.updates - updates0) / dt:.0f}/s  " \
+               f"p99 latency {p99:.3f} ms"
+
+    def run(self):
+        t0 = time.perf_counter()
+        updates0 = self.counters.updates
+        while not self._done.wait(self.period):
+            t = time.perf_counter()
+            print(self.line(t - t0, updates0), flush=True)
+            t0, updates0 = t, self.counters.updates
+
+    def stop(self):
+        self._done.set()
+        self.join()
@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+
+"""Check that every filter's process_block gives, bit for bit, what k
+sequential __call__s give, also when the samples are cut into uneven
+blocks, and with scipy's public sosfilt as well as its compiled kernel;
+and that filterRefSens, the offline filtering of the refs for the .fif
+conversion, gives what the online filter gave.
+
+    Usage, from v2:
+        python test/testFilters.py
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import filters
+from filters import nofilt, ema, cheby2, elliptic, bessel, cascade, minphase
+from constants import struct, fs
+from npy2fif_7x8 import filterRefSens
+
+nRef = 3
+
+makeFilter = {'nofilt': lambda: nofilt(nRef),
+              'ema': lambda: ema(nRef, .03),
+              'cheby2': lambda: cheby2(nRef, 13),
+              'elliptic': lambda: elliptic(nRef, 13),
+              'bessel': lambda: bessel(nRef, 13),
+              'cascade': lambda: cascade(nRef, 13, N=3),
+              'minphase': lambda: minphase(nRef, 13)}
+
+
+def filterCalls(filt, x):
+    "Filter x one sample at a time, as the online loop did."
+
+    filt.restart()
+    return np.array([filt(row) for row in x])
+
+
+def testBlocks(filterName, nSamples=10000):
+    "process_block vs __call__, in one block and in uneven blocks."
+
+    filt = makeFilter[filterName]()
+    x = np.random.default_rng(0).standard_normal((nSamples, nRef)) * 100
+    y = filterCalls(filt, x)
+
+    filt.restart()
+    assert np.array_equal(y, filt.process_block(x)), f"{filterName}: process_block differs from __call__"
+
+    filt.restart()
+    cuts = np.cumsum(np.random.default_rng(1).integers(1, 20, nSamples // 5))
+    yBlocks = np.vstack([filt.process_block(b) for b in np.split(x, cuts[cuts < nSamples])])
+    assert np.array_equal(y, yBlocks), f"{filterName}: state not carried exactly across blocks"
+
+
+def testFilterRefSens(filterName, nSamples=150*fs):
+    "filterRefSens vs the per-sample loop, with the default and uneven chunks."
+
+    filt = makeFilter[filterName]()
+    s_data = struct()
+    s_data.rawDataRef = np.random.default_rng(0).standard_normal((nSamples, nRef)) * 100
+    y = filterCalls(filt, s_data.rawDataRef)
+
+    assert np.array_equal(y, filterRefSens(s_data, filt)), f"{filterName}: filterRefSens differs from the online filter"
+    assert np.array_equal(y, filterRefSens(s_data, filt, chunk=7777)), f"{filterName}: state lost between chunks"
+
+
+if __name__ == '__main__':
+
+    for filterName in makeFilter:
+        testBlocks(filterName)
+        print(f"{filterName}: ok")
+
+    # the same with signal.sosfilt, used when the kernel fails checkKernel()
+
+    filters.loadSignal()
+    kernel, filters._sosfilt = filters._sosfilt, None
+    for filterName in ['cheby2', 'elliptic', 'bessel', 'cascade']:
+        testBlocks(filterName)
+        print(f"{filterName} (signal.sosfilt): ok")
+    filters._sosfilt = kernel
+
+    for filterName in makeFilter:
+        testFilterRefSens(filterName)
+        print(f"{filterName} (filterRefSens): ok")